@@ -0,0 +1,45 @@
+"""
+Compare the ticks per second of VectorizedSimulator driven by the
+queue-aware controllers against the same simulator stepping a fixed-time
+round-robin schedule tick by tick, on a Hash Code input.
+
+Usage: python -m benchmarks.bench_control [data/d.txt] [ticks]
+"""
+import sys
+import time
+
+from simulation.control import GapOutController, LongestQueueController, \
+    MaxPressureController
+from simulation.engine import VectorizedSimulator
+
+
+def bench_control(filepath='data/d.txt', ticks=1000):
+    simulator = VectorizedSimulator()
+    simulator.load_text(filepath)
+    simulator.sim_len = min(ticks, simulator.sim_len)
+    results = {}
+
+    def run_fixed():
+        simulator._set_schedules([simulator.get_round_robin_schedules(
+            [1] * int(simulator.in_degree.sum()))])
+        for simulator.clock in range(simulator.sim_len):
+            simulator.tick()
+
+    runs = {'fixed_time': run_fixed}
+    for controller in [LongestQueueController(), MaxPressureController(), GapOutController()]:
+        runs[type(controller).__name__] = \
+            lambda controller=controller: simulator.simulate_controlled(controller)
+    for name, run in runs.items():
+        simulator.reset()
+        start = time.perf_counter()
+        run()
+        results[name] = {'ticks_per_s': simulator.sim_len / (time.perf_counter() - start),
+                         'reward': int(simulator.get_reward())}
+    return results
+
+
+if __name__ == '__main__':
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'data/d.txt'
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    for name, result in bench_control(filepath, ticks).items():
+        print(f"{name:>22}: {result['ticks_per_s']:8.1f} ticks/s, reward {result['reward']}")
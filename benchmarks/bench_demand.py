@@ -0,0 +1,66 @@
+"""
+Time ODDemand on seeded k-in networks of growing size: computing the
+next-hop tables, loading them back from the disk cache, and drawing the
+routes of many cars in bulk. On a small random network, the length of
+every route is checked against networkx shortest paths on
+Network.to_networkx_graph (which keeps a single road between two junctions,
+so k-in networks with parallel roads are not checked).
+
+Usage: python -m benchmarks.bench_demand [junction_num ...]
+"""
+import sys
+import tempfile
+import time
+
+import networkx as nx
+import numpy as np
+
+from simulation.arrays import NetworkArrays
+from simulation.demand import ODDemand
+
+
+def check_shortest(junction_num=100, car_num=1000, seed=0):
+    """ Whether every route is as short as the networkx reference """
+    network_arrays = NetworkArrays.generate_random(junction_num, np.random.default_rng(seed))
+    G = network_arrays.to_network().to_networkx_graph()
+    route_offsets, route_roads = ODDemand(16).generate_routes(network_arrays, car_num,
+                                                               np.random.default_rng(seed))
+    for i in range(car_num):
+        route = route_roads[route_offsets[i]:route_offsets[i + 1]]
+        length = nx.shortest_path_length(G, network_arrays.road_exit[route[0]],
+                                         network_arrays.road_exit[route[-1]], weight='weight')
+        if network_arrays.road_length[route[1:]].sum() != length:
+            return False
+    return True
+
+
+def bench_demand(junction_num, car_num=None, destination_num=256, seed=0):
+    car_num = car_num or 5 * junction_num
+    network_arrays = NetworkArrays.generate_k_in(junction_num, 3, np.random.default_rng(seed))
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        demand = ODDemand(destination_num, cache_dir)
+        destinations = np.arange(min(destination_num, junction_num))
+        for name in ['next_hops_s', 'cached_next_hops_s']:
+            start = time.perf_counter()
+            demand.load_next_hops(network_arrays, destinations)
+            results[name] = time.perf_counter() - start
+        demand.generate_routes(network_arrays, 1, np.random.default_rng(seed))
+        start = time.perf_counter()
+        route_offsets, _ = demand.generate_routes(network_arrays, car_num,
+                                                  np.random.default_rng(seed))
+        results['routes_s'] = time.perf_counter() - start
+    results['car_num'] = car_num
+    results['mean_route_len'] = float(np.diff(route_offsets).mean())
+    return results
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f'routes as short as networkx: {check_shortest()}')
+    for junction_num in sizes:
+        results = bench_demand(junction_num)
+        print(f"{junction_num:>7} junctions: next hops {results['next_hops_s']:7.3f}s "
+              f"(cached {results['cached_next_hops_s']:6.3f}s), "
+              f"{results['car_num']} routes {results['routes_s']:6.3f}s "
+              f"(mean {results['mean_route_len']:.1f} roads)")
@@ -0,0 +1,47 @@
+"""
+Measure the throughput of LocalSearch on a Hash Code input, against
+re-scoring every step from scratch with HashCodeScorer, and check that the
+incremental score of the schedules found matches a full re-scoring.
+
+Usage: python -m benchmarks.bench_local_search [data/b.txt] [seconds]
+"""
+import sys
+import time
+
+from emulation.local_search import LocalSearch
+from simulation.schedule import PeriodicSchedule
+from simulation.scoring import HashCodeScorer
+
+
+def bench_local_search(filepath='data/b.txt', seconds=10, seed=0):
+    search = LocalSearch.from_text(filepath, seed=seed)
+    scorer = HashCodeScorer(search.scorer.text_input)
+    results = {'junction_num': search.scorer.text_input.junction_num}
+
+    initial = [PeriodicSchedule(duration) for duration in search.get_initial_durations()]
+    start = time.perf_counter()
+    evaluations = 0
+    while evaluations == 0 or time.perf_counter() - start < min(seconds, 1):
+        results['initial_score'] = scorer.score(initial)
+        evaluations += 1
+    results['full_evals_per_s'] = evaluations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    schedules, score = search.optimize(iterations=10 ** 9, max_time=seconds)
+    results['incremental_evals_per_s'] = search.evaluations / (time.perf_counter() - start)
+    results['evaluations'] = search.evaluations
+    results['accepted'] = search.accepted
+    results['score'] = score
+    assert scorer.score(schedules) == score
+    return results
+
+
+if __name__ == '__main__':
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'data/b.txt'
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    results = bench_local_search(filepath, seconds)
+    print(f"{filepath}: {results['junction_num']} junctions")
+    print(f"       full: {results['full_evals_per_s']:8.1f} evaluations/s")
+    print(f"incremental: {results['incremental_evals_per_s']:8.1f} evaluations/s "
+          f"({results['evaluations']} steps, {results['accepted']} kept)")
+    print(f"      score: {results['initial_score']} -> {results['score']}")
@@ -0,0 +1,132 @@
+"""
+Measure the memory taken by the object model (Junction, Road and Car
+objects) built by Simulator.initialize_from_text, per car and per road, and
+by the arrays of VectorizedSimulator.load_text for comparison. As a
+baseline, the same network and cars are also built out of plain objects
+without __slots__, each car holding a list of roads and each road a list
+of queued cars, as the object model was originally. Memory is traced with
+tracemalloc. The roads are charged for the network (including the
+junctions) as built on its own, and the cars for the rest (including the
+queues they start in) bar the initial state.
+
+Usage: python -m benchmarks.bench_memory [data/d.txt]
+"""
+import gc
+import sys
+import tracemalloc
+
+from simulation.arrays import NetworkArrays
+from simulation.engine import VectorizedSimulator
+from simulation.loader import TextInput
+from simulation.schedule import Schedule
+from simulation.simulator import Simulator
+
+
+class _PlainJunction:
+    def __init__(self, name):
+        self.name = name
+        self.in_rds = []
+        self.out_rds = []
+        self.schedule = Schedule()
+
+
+class _PlainRoad:
+    def __init__(self, name, length, origin, exit):
+        self.name = name
+        self.length = length
+        self.queue = []
+        self.origin = origin
+        self.exit = exit
+
+
+class _PlainCar:
+    def __init__(self, name, route):
+        self.name = name
+        self.idx = 0
+        self.dist = 0
+        self.route = route
+        self.reward = 0
+
+
+def _traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def _build_plain_network(text_input: TextInput):
+    junctions = [_PlainJunction(f'junction_{i}') for i in range(text_input.junction_num)]
+    roads = []
+    for name, origin, exit, length in zip(text_input.road_names.tolist(),
+                                          text_input.road_origin.tolist(),
+                                          text_input.road_exit.tolist(),
+                                          text_input.road_length.tolist()):
+        road = _PlainRoad(name, length, junctions[origin], junctions[exit])
+        junctions[origin].out_rds.append(road)
+        junctions[exit].in_rds.append(road)
+        roads.append(road)
+    return junctions, roads
+
+
+def _build_plain_cars(text_input: TextInput, roads):
+    cars = []
+    offsets = text_input.route_offsets.tolist()
+    route_roads = text_input.route_roads.tolist()
+    for i in range(text_input.car_num):
+        car = _PlainCar(f'car_{i}', [roads[j] for j in route_roads[offsets[i]:offsets[i + 1]]])
+        car.dist = car.route[0].length
+        car.route[0].queue.append(car)
+        cars.append(car)
+    return cars
+
+
+def bench_memory(filepath='data/d.txt'):
+    text_input = TextInput.load(filepath)
+    results = {'road_num': text_input.road_num, 'car_num': text_input.car_num,
+               'route_road_num': len(text_input.route_roads)}
+
+    tracemalloc.start()
+    start = _traced()
+    simulator = Simulator()
+    simulator.initialize_from_text(filepath)
+    total = _traced() - start
+    state = simulator.initial_state
+    total -= sum(getattr(state, name).nbytes for name in ['idx', 'dist', 'reward', 'top', 'below'])
+    del simulator, state
+
+    start = _traced()
+    network = NetworkArrays(text_input.junction_num, text_input.road_origin,
+                            text_input.road_exit, text_input.road_length) \
+        .to_network(text_input.road_names.tolist())
+    network_bytes = _traced() - start
+    del network
+    results['road_bytes'] = network_bytes / text_input.road_num
+    results['car_bytes'] = (total - network_bytes) / text_input.car_num
+
+    start = _traced()
+    junctions, roads = _build_plain_network(text_input)
+    network_bytes = _traced() - start
+    cars = _build_plain_cars(text_input, roads)
+    total = _traced() - start
+    del junctions, roads, cars
+    results['plain_road_bytes'] = network_bytes / text_input.road_num
+    results['plain_car_bytes'] = (total - network_bytes) / text_input.car_num
+
+    start = _traced()
+    vectorized = VectorizedSimulator()
+    vectorized.load_text(filepath)
+    results['vectorized_bytes'] = _traced() - start
+    tracemalloc.stop()
+    return results
+
+
+if __name__ == '__main__':
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'data/d.txt'
+    results = bench_memory(filepath)
+    print(f"{filepath}: {results['road_num']} roads, {results['car_num']} cars "
+          f"({results['route_road_num']} roads on routes)")
+    print(f"{'':>9}  {'plain':>8}  {'slotted':>8}")
+    for name in ['road', 'car']:
+        print(f"{name + 's':>9}: {results[f'plain_{name}_bytes']:8.0f}  "
+              f"{results[f'{name}_bytes']:8.0f} bytes per {name}"
+              + (' (with junctions)' if name == 'road' else ''))
+    print(f"   arrays: {results['vectorized_bytes'] / 1e6:8.1f} MB in total")
@@ -0,0 +1,69 @@
+"""
+Compare the evaluation of periodic schedules with util.get_bin_idx (one call
+per junction per tick) against the precompiled lookup tables, both per
+junction (PeriodicSchedule.get_incoming_at) and stacked for the whole
+network (as VectorizedSimulator does), at the scale of a Hash Code input.
+
+Usage: python -m benchmarks.bench_schedule [data/d.txt] [ticks]
+"""
+import sys
+import time
+
+import numpy as np
+
+from simulation.schedule import PeriodicSchedule
+from simulation.util import get_bin_idx
+
+
+def bench_schedule(filepath='data/d.txt', ticks=1000, seed=0):
+    with open(filepath, 'r') as f:
+        duration, junction_num, _, _, _ = tuple(map(int, f.readline().strip().split()))
+    ticks = min(ticks, duration)
+
+    rng = np.random.default_rng(seed)
+    durations = rng.integers(1, 60, (junction_num, 2)).tolist()
+    results = {'junction_num': junction_num, 'ticks': ticks}
+
+    start = time.perf_counter()
+    old = 0
+    for t in range(ticks):
+        for duration in durations:
+            old += get_bin_idx(duration, t)
+    results['get_bin_idx'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    schedules = [PeriodicSchedule(duration) for duration in durations]
+    results['compile'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = 0
+    for t in range(ticks):
+        for schedule in schedules:
+            new += schedule.get_incoming_at(t)
+    results['table'] = time.perf_counter() - start
+    assert old == new
+
+    start = time.perf_counter()
+    cycle_len = np.array([schedule.cycle_len for schedule in schedules])
+    offset = np.zeros(junction_num, dtype=np.int64)
+    np.cumsum(cycle_len[:-1], out=offset[1:])
+    pool = np.concatenate([schedule.table for schedule in schedules])
+    stacked = 0
+    for t in range(ticks):
+        stacked += pool[offset + t % cycle_len].sum()
+    results['stacked_table'] = time.perf_counter() - start
+    assert old == stacked
+
+    return results
+
+
+if __name__ == '__main__':
+    filepath = sys.argv[1] if len(sys.argv) > 1 else 'data/d.txt'
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    results = bench_schedule(filepath, ticks)
+    evaluations = results['junction_num'] * results['ticks']
+    print(f"{filepath}: {results['junction_num']} junctions x {results['ticks']} ticks")
+    for key in ['get_bin_idx', 'table', 'stacked_table']:
+        print(f'{key:>14}: {results[key]:8.3f}s '
+              f'({evaluations / results[key] / 1e6:7.2f}M evaluations/s)')
+    print(f"{'compile':>14}: {results['compile']:8.3f}s")
@@ -0,0 +1,52 @@
+"""
+Time Network.transform to a fixed in-degree k on random directed networks
+(networkx gnm graphs, so in-degrees vary around the mean degree) of growing
+size, to check that the cost per road stays flat. As with timeit, garbage
+collection is disabled while timing.
+
+Usage: python -m benchmarks.bench_transform [junction_num] [mean_degree] [k ...]
+"""
+import gc
+import random
+import sys
+import time
+
+import networkx as nx
+
+from simulation.network import Network
+
+
+def bench_transform(junction_num=100000, mean_degree=3, ks=(2, 3, 4), seed=0):
+    results = []
+    for size in [junction_num // 10, junction_num]:
+        G = nx.gnm_random_graph(size, size * mean_degree, directed=True, seed=seed)
+        for k in ks:
+            random.seed(seed)
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            network = Network.generate_from_networkx(G)
+            build = time.perf_counter() - start
+
+            road_num = len(network.roads)
+            start = time.perf_counter()
+            network.transform(k)
+            transform = time.perf_counter() - start
+            gc.enable()
+            assert all(len(junction.in_rds) == k for junction in network.junctions)
+
+            results.append({'junction_num': size, 'k': k, 'road_num': road_num,
+                            'new_road_num': len(network.roads),
+                            'build': build, 'transform': transform})
+    return results
+
+
+if __name__ == '__main__':
+    junction_num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    mean_degree = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    ks = [int(k) for k in sys.argv[3:]] or [2, 3, 4]
+    for result in bench_transform(junction_num, mean_degree, ks):
+        print(f"{result['junction_num']:>8} junctions, k={result['k']}: "
+              f"{result['road_num']} -> {result['new_road_num']} roads, "
+              f"build {result['build']:6.2f}s, transform {result['transform']:6.2f}s "
+              f"({result['transform'] / result['new_road_num'] * 1e6:5.2f}us per road)")
@@ -0,0 +1,271 @@
+"""
+Repeatable benchmark suite of the simulators, loaders, generators and the
+emulator objective, on the Hash Code inputs data/a.txt to f.txt and on
+seeded ring, random and k-in networks of several sizes.
+
+For every workload it measures (metric names end with their unit):
+- parse_s, cached_load_s: parsing the input file, and loading the binary
+  cache (Hash Code inputs only)
+- generate_s, routes_s: generating the network arrays and the routes
+  (synthetic networks only)
+- setup_s, compile_s: building the Simulator objects, and compiling them
+  into a VectorizedSimulator
+- object_ticks_per_s, vectorized_ticks_per_s: ticks per second of
+  Simulator.tick and of a full VectorizedSimulator run
+- <schedule_type>_evals_per_s: candidates per second of the emulator
+  objective (ParallelEvaluator, in-process and without cache) for each
+  schedule type
+- object_peak_bytes, vectorized_peak_bytes: peak memory traced while
+  setting up (and, for the arrays, running) each simulator
+
+The results are written as JSON, and compared against a baseline written
+by an earlier run if one is given: the ratio of every metric to the
+baseline is reported, and those that got worse by more than the threshold
+are flagged as regressions.
+
+Usage: python -m benchmarks.suite [--quick] [--only a,b,ring_1000]
+                                  [--output results.json] [--baseline old.json]
+                                  [--threshold 0.2]
+"""
+import argparse
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from emulation.parallel import ParallelEvaluator
+from simulation.arrays import NetworkArrays
+from simulation.engine import VectorizedSimulator
+from simulation.loader import TextInput
+from simulation.simulator import Simulator
+
+TEXT_INPUTS = ['a', 'b', 'c', 'd', 'e', 'f']
+SYNTHETIC_KINDS = ['ring', 'random', 'k_in']
+SYNTHETIC_SIZES = [100, 1000, 10000]
+SCHEDULE_TYPES = ['uniform', 'distinct', 'preset', 'forced_preset']
+# Seconds over which the cheap steps (parsing, loading, generating, setting
+# up and compiling) are repeated, keeping the fastest run
+REPEAT_TIME = 0.2
+
+
+def _get_candidates(schedule_type, junction_num, candidate_num, rng, mode_num=2):
+    """ Random candidates drawn from the domains of emulator.py """
+    durations = lambda n: rng.integers(1, 60, (candidate_num, n))
+    if schedule_type == 'uniform':
+        return durations(2)
+    if schedule_type == 'distinct':
+        return durations(2 * junction_num)
+    modes = rng.integers(0, mode_num, (candidate_num, junction_num))
+    if schedule_type == 'preset':
+        return np.hstack([durations(2 * mode_num), modes])
+    cycle_len = (mode_num + 1) * rng.integers(1, 30, (candidate_num, 1))
+    return np.hstack([cycle_len, modes])
+
+
+def _timed(function, *args, min_time=0):
+    """
+    Result and seconds of a call to function, the fastest of as many calls
+    as fit in min_time (at least one) for steps that can be repeated
+    """
+    gc.collect()
+    best, total = None, 0
+    while best is None or total < min_time:
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+    return result, best
+
+
+def _traced_peak(function, *args):
+    gc.collect()
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_simulator(simulator: Simulator, ticks, candidate_num, seed):
+    """ Simulation metrics of an initialized simulator, which is left reset """
+    results = {}
+    vectorized, results['compile_s'] = _timed(VectorizedSimulator.from_simulator, simulator,
+                                               min_time=REPEAT_TIME)
+
+    ticks = min(ticks, simulator.sim_len)
+    simulator.reset()
+    state = simulator.snapshot()
+
+    def run_object_ticks():
+        for simulator.clock in range(ticks):
+            simulator.tick()
+
+    _, elapsed = _timed(run_object_ticks)
+    results['object_ticks_per_s'] = ticks / elapsed
+    simulator.restore(state)
+
+    schedules = vectorized.get_uniform_schedules(3, 4)
+    vectorized.reset()
+    _, elapsed = _timed(vectorized.simulate, schedules)
+    results['vectorized_ticks_per_s'] = vectorized.sim_len / elapsed
+
+    rng = np.random.default_rng(seed)
+    for schedule_type in SCHEDULE_TYPES:
+        vectorized.reset()
+        X = _get_candidates(schedule_type, vectorized.junction_num, candidate_num, rng)
+        f = ParallelEvaluator(vectorized, schedule_type)
+        _, elapsed = _timed(f, X)
+        results[f'{schedule_type}_evals_per_s'] = len(X) / elapsed
+    return results
+
+
+def bench_text(filepath, ticks=20, candidate_num=8, seed=0):
+    results = {}
+    _, results['parse_s'] = _timed(TextInput.parse, filepath, min_time=REPEAT_TIME)
+    TextInput.load(filepath)
+    _, results['cached_load_s'] = _timed(TextInput.load, filepath, min_time=REPEAT_TIME)
+
+    def initialize():
+        simulator = Simulator()
+        simulator.initialize_from_text(filepath)
+        return simulator
+
+    def run_vectorized():
+        vectorized = VectorizedSimulator()
+        vectorized.load_text(filepath)
+        vectorized.simulate(vectorized.get_uniform_schedules(3, 4))
+
+    simulator, results['setup_s'] = _timed(initialize, min_time=REPEAT_TIME)
+    results.update(bench_simulator(simulator, ticks, candidate_num, seed))
+    del simulator
+    results['object_peak_bytes'] = _traced_peak(initialize)
+    results['vectorized_peak_bytes'] = _traced_peak(run_vectorized)
+    return results
+
+
+def bench_synthetic(kind, junction_num, car_num=None, ticks=100, candidate_num=8, seed=0):
+    """ Seeded network of the given kind (ring, random or k_in with k = 3) """
+    car_num = car_num or 10 * junction_num
+    generate = {'ring': NetworkArrays.generate_ring,
+                'random': NetworkArrays.generate_random,
+                'k_in': lambda n, rng: NetworkArrays.generate_k_in(n, 3, rng)}[kind]
+    results = {}
+    # Every repetition draws the same network and routes
+    network_arrays, results['generate_s'] = _timed(
+        lambda: generate(junction_num, np.random.default_rng(seed)), min_time=REPEAT_TIME)
+    _, results['routes_s'] = _timed(
+        lambda: network_arrays.generate_routes(car_num, np.random.default_rng(seed)),
+        min_time=REPEAT_TIME)
+
+    def initialize():
+        simulator = Simulator()
+        simulator._initialize_random_cars(network_arrays, car_num, np.random.default_rng(seed))
+        return simulator
+
+    def run_vectorized():
+        vectorized = VectorizedSimulator()
+        vectorized._initialize_random_cars(network_arrays, car_num,
+                                           np.random.default_rng(seed))
+        vectorized.simulate(vectorized.get_uniform_schedules(3, 4))
+
+    simulator, results['setup_s'] = _timed(initialize, min_time=REPEAT_TIME)
+    results.update(bench_simulator(simulator, ticks, candidate_num, seed))
+    del simulator
+    results['object_peak_bytes'] = _traced_peak(initialize)
+    results['vectorized_peak_bytes'] = _traced_peak(run_vectorized)
+    return results
+
+
+def get_workloads(quick=False):
+    """ Name and benchmark of every workload, the quick ones only if quick """
+    workloads = {}
+    for name in (['a', 'b', 'e'] if quick else TEXT_INPUTS):
+        workloads[name] = lambda name=name: bench_text(f'data/{name}.txt')
+    for kind in SYNTHETIC_KINDS:
+        for size in (SYNTHETIC_SIZES[:2] if quick else SYNTHETIC_SIZES):
+            workloads[f'{kind}_{size}'] = lambda kind=kind, size=size: bench_synthetic(kind, size)
+    return workloads
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform()}
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Ratio of every metric to the baseline, by workload, and the metrics that
+    got worse by more than threshold (rates are better higher, times and
+    memory lower)
+    """
+    ratios = {}
+    regressions = []
+    for workload, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(workload, {}).get(metric)
+            if not old:
+                continue
+            ratio = value / old
+            ratios.setdefault(workload, {})[metric] = ratio
+            worse = ratio < 1 / (1 + threshold) if metric.endswith('_per_s') \
+                else ratio > 1 + threshold
+            if worse:
+                regressions.append(f'{workload}.{metric}')
+    return ratios, regressions
+
+
+def run_suite(quick=False, only=None, baseline_path=None, threshold=0.2):
+    workloads = get_workloads(quick)
+    if only:
+        workloads = {name: workloads[name] for name in only}
+    report = {'metadata': get_metadata(), 'results': {}}
+    for name, benchmark in workloads.items():
+        report['results'][name] = benchmark()
+        print(f'{name}: ' + ', '.join(f'{metric}={value:.4g}' for metric, value
+                                      in report['results'][name].items()), flush=True)
+
+    if baseline_path is not None:
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+        ratios, regressions = compare(report['results'], baseline['results'], threshold)
+        report['baseline'] = {'path': baseline_path, 'metadata': baseline['metadata'],
+                              'threshold': threshold, 'ratios': ratios,
+                              'regressions': regressions}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the benchmark suite')
+    parser.add_argument('--quick', action='store_true',
+                        help='only the small inputs and networks')
+    parser.add_argument('--only', type=lambda names: names.split(','),
+                        help='comma-separated workloads to run, e.g. a,b,ring_1000')
+    parser.add_argument('--output', default='benchmarks.json',
+                        help='where to write the results')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change flagged as a regression')
+    args = parser.parse_args()
+
+    report = run_suite(args.quick, args.only, args.baseline, args.threshold)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if 'baseline' in report:
+        for workload, ratios in report['baseline']['ratios'].items():
+            print(f'{workload}: ' + ', '.join(f'{metric} x{ratio:.2f}'
+                                              for metric, ratio in ratios.items()))
+        regressions = report['baseline']['regressions']
+        print(f"{len(regressions)} regressions: {', '.join(regressions) or 'none'}")
+        sys.exit(1 if regressions else 0)
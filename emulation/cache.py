@@ -0,0 +1,91 @@
+import sqlite3
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EvaluationCache:
+    """
+    Rewards of schedules that have already been simulated, so that the
+    emulators never simulate the same integer schedule twice
+
+    An entry is keyed by the fingerprint of the simulator it was simulated on
+    (see VectorizedSimulator.get_fingerprint), the encoding of its parameters
+    (schedule type and number of preset modes, see Simulator.get_schedules)
+    and the parameters cast to integers. The most recently used entries are
+    kept in memory, and every entry is also stored in an SQLite database if
+    a path is given, which can be shared by any number of runs, emulators
+    and schedule types (concurrent runs included).
+
+    Attributes
+    ----------
+    path: path of the database, None to keep the entries in memory only
+    capacity: maximum number of entries kept in memory
+    hits: number of lookups answered from the cache
+    misses: number of lookups that had to be simulated
+    """
+
+    def __init__(self, path=None, capacity=100000):
+        self.path = path
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, timeout=60)
+            self._db.execute('CREATE TABLE IF NOT EXISTS evaluations ('
+                             'fingerprint TEXT, schedule_type TEXT, mode_num INTEGER, '
+                             'params BLOB, reward INTEGER, '
+                             'PRIMARY KEY (fingerprint, schedule_type, mode_num, params))')
+            self._db.commit()
+
+    @staticmethod
+    def get_params(X):
+        """ Parameter vectors cast to integers, as Simulator.get_schedules does """
+        return np.atleast_2d(X).astype(np.int64)
+
+    def get(self, fingerprint, schedule_type, mode_num, X):
+        """ Cached reward of each row of X, and whether it was found """
+        params = self.get_params(X)
+        rewards = np.zeros(len(params), dtype=np.int64)
+        found = np.zeros(len(params), dtype=bool)
+        for i, x in enumerate(params):
+            key = (fingerprint, schedule_type, mode_num, x.tobytes())
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                rewards[i] = self._entries[key]
+                found[i] = True
+            elif self._db is not None:
+                row = self._db.execute('SELECT reward FROM evaluations WHERE fingerprint = ? '
+                                       'AND schedule_type = ? AND mode_num = ? AND params = ?',
+                                       key).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    rewards[i] = row[0]
+                    found[i] = True
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return rewards, found
+
+    def put(self, fingerprint, schedule_type, mode_num, X, rewards):
+        params = self.get_params(X)
+        entries = [((fingerprint, schedule_type, mode_num, x.tobytes()), reward)
+                   for x, reward in zip(params, np.asarray(rewards).tolist())]
+        for key, reward in entries:
+            self._remember(key, reward)
+        if self._db is not None:
+            self._db.executemany('INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?)',
+                                 [key + (reward,) for key, reward in entries])
+            self._db.commit()
+
+    def _remember(self, key, reward):
+        self._entries[key] = reward
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
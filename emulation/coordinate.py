@@ -0,0 +1,90 @@
+import numpy as np
+
+from simulation.engine import VectorizedSimulator
+from simulation.simulator import Simulator
+
+
+class BlockCoordinateOptimizer:
+    """
+    Optimizes distinct schedules (see Simulator.get_schedules) one junction
+    at a time, instead of as a single 2 x junction_num dimensional black box
+
+    Junctions are visited in decreasing order of the waiting on their roads
+    in the current schedules (see VectorizedSimulator.get_junction_wait);
+    those where no car ever waits, or with a single road in, are skipped,
+    since their schedules make no difference. The candidate durations of a
+    junction are all simulated in one batch, on a simulator restricted to
+    the cars going through it (see VectorizedSimulator.get_local). The best
+    candidate, if better than the current durations there, is then checked
+    with a full simulation, and kept only if the total reward improves.
+
+    Attributes
+    ----------
+    simulator: compiled simulator, whose current state every run starts from
+    durations: red and green durations to choose from
+    candidate_num: number of random candidates tried at each junction
+    reward: total reward of the current schedules
+    junction_wait: waiting on the roads into each junction with the current
+                   schedules
+    evaluations: number of schedules simulated, in full or restricted
+    """
+
+    def __init__(self, simulator: Simulator, durations=range(1, 60), candidate_num=32,
+                 seed=0):
+        if isinstance(simulator, VectorizedSimulator):
+            self.simulator = simulator
+        else:
+            self.simulator = VectorizedSimulator.from_simulator(simulator)
+        self.durations = np.asarray(durations)
+        self.candidate_num = candidate_num
+        self.reward = None
+        self.junction_wait = None
+        self.evaluations = 0
+        self._rng = np.random.default_rng(seed)
+
+    def _evaluate(self, x):
+        """ Reward and waiting per junction of the full simulation of x """
+        simulator = self.simulator
+        state = simulator.snapshot()
+        simulator.simulate(simulator.get_schedules(x, 'distinct'))
+        reward, junction_wait = simulator.get_reward(), simulator.get_junction_wait()[0]
+        simulator.restore(state)
+        self.evaluations += 1
+        return reward, junction_wait
+
+    def optimize_junction(self, x, junction):
+        """ Try other durations at one junction, and return whether x was improved """
+        candidates = self._rng.choice(self.durations, (self.candidate_num, 2))
+        X = np.tile(x, (self.candidate_num + 1, 1))
+        X[1:, 2 * junction:2 * junction + 2] = candidates
+        local = self.simulator.get_local([junction])
+        rewards = local.simulate_batch(X, 'distinct')
+        self.evaluations += len(X)
+        best = int(np.argmax(rewards))
+        if rewards[best] <= rewards[0]:
+            return False
+
+        reward, junction_wait = self._evaluate(X[best])
+        if reward <= self.reward:
+            return False
+        x[:] = X[best]
+        self.reward, self.junction_wait = reward, junction_wait
+        return True
+
+    def optimize(self, x, sweeps=1):
+        """
+        Improve the distinct schedules x ([red_0, green_0, red_1, ...]) with
+        sweeps passes over the junctions, and return them with their reward
+        """
+        x = np.array(x, dtype=np.int64)
+        self.reward, self.junction_wait = self._evaluate(x)
+        in_degree = self.simulator.in_degree
+        for _ in range(sweeps):
+            improved = False
+            for junction in np.argsort(-self.junction_wait, kind='stable').tolist():
+                if self.junction_wait[junction] == 0 or in_degree[junction] <= 1:
+                    continue
+                improved |= self.optimize_junction(x, junction)
+            if not improved:
+                break
+        return x, self.reward
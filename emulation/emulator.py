@@ -1,11 +1,25 @@
 import random
+import time
 random.seed(398)
 
-import numpy as np
 import GPy
 
-from GPyOpt.methods import BayesianOptimization
+from GPyOpt.acquisitions import AcquisitionEI, AcquisitionLP
+from GPyOpt.core.evaluators import LocalPenalization, Sequential
+from GPyOpt.core.task.cost import CostModel
+from GPyOpt.core.task.objective import Objective
+from GPyOpt.core.task.space import Design_space
+from GPyOpt.experiment_design import initial_design
+from GPyOpt.methods import ModularBayesianOptimization
+from GPyOpt.models import GPModel
+from GPyOpt.optimization import AcquisitionOptimizer
 
+from emulation.cache import EvaluationCache
+from emulation.coordinate import BlockCoordinateOptimizer
+from emulation.fidelity import MultiFidelityEvaluator
+from emulation.parallel import ParallelEvaluator
+from simulation.demand import ODDemand
+from simulation.profiler import Profiler
 from simulation.simulator import Simulator
 
 network_options = ['text', 'random', 'ring']
@@ -13,12 +27,38 @@ schedule_options = ['uniform', 'distinct', 'preset', 'forced_preset']
 network_type = 'random'
 junction_num = 40
 car_num = 400
+# Drive the cars of random networks to a few destinations along shortest
+# routes (see ODDemand) rather than on random walks. The next-hop tables are
+# cached on disk next to the evaluations, keyed by network fingerprint.
+od_demand = False
+demand = ODDemand(destination_num=8, cache_dir='../data/cache') if od_demand else None
+# Set to False to reproduce the results in plots/ (last-in-first-out queues)
+fifo = True
+# Set to True to reproduce the networks of plots/, drawn from random one
+# object at a time rather than from NetworkArrays (demand is then ignored)
+legacy_network = False
+num_cores = 1
+batch_size = 1
+# Rewards already simulated, shared with emulator2.py
+cache = EvaluationCache('../data/evaluations.sqlite3')
+# Let the optimizer choose the fidelity of each evaluation, weighing the
+# measured cost of each one (see MultiFidelityEvaluator)
+multi_fidelity = False
+# Refine the best distinct schedules found one junction at a time, on the
+# cars going through it (see BlockCoordinateOptimizer)
+block_coordinate = False
+# Time the simulations and the model fitting of each optimization, and dump
+# them (and their sum over the session) to JSON next to the plots
+profile = False
+session_profiler = Profiler() if profile else None
 
-simulator = Simulator()
+simulator = Simulator(fifo=fifo)
 if network_type == 'random':
-    simulator.initialize_random_network(junction_num=junction_num, car_num=car_num)
+    simulator.initialize_random_network(junction_num=junction_num, car_num=car_num,
+                                        demand=demand, legacy=legacy_network)
 elif network_type == 'random_ring':
-    simulator.initialize_random_ring(junction_num=junction_num, car_num=car_num)
+    simulator.initialize_random_ring(junction_num=junction_num, car_num=car_num, demand=demand,
+                                     legacy=legacy_network)
 elif network_type == 'text':
     simulator.initialize_from_text('../data/f.txt')
     junction_num = len(simulator.network.junctions)
@@ -29,25 +69,30 @@ simulator.network.draw()
 # for i in range(1, 300):
 #     simulator.cars[i].route = simulator.cars[0].route
 
+
+class EvaluatorObjective(Objective):
+    """
+    GPyOpt objective that hands every batch suggested by the optimizer to
+    an evaluator (see ParallelEvaluator), whose process pool runs it,
+    instead of GPyOpt forking one process per core for every batch
+    """
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+    def evaluate(self, x):
+        return self.evaluator.evaluate(x)
+
+
 def optimize(schedule_type, max_iter=300, mode_num=2):
-    def f(x):
-        simulator.reset()
-        x = list(map(int, x))
-        if network_type == 'text':
-            for car in simulator.cars:
-                car.dist = car.route[0].length
-                car.route[0].enqueue(car)
-        if schedule_type == 'uniform':
-            simulator.simulate_uniform(x[0], x[1])
-        elif schedule_type == 'distinct':
-            simulator.simulate_distinct(x[::2], x[1::2])
-        elif schedule_type == 'preset':
-            simulator.simulate_preset(x[:mode_num], x[mode_num:mode_num * 2], x[mode_num * 2:])
-        elif schedule_type == 'forced_preset':
-            red_lens = [int(x[0] * i / (mode_num + 1)) for i in range(1, mode_num + 1)]
-            green_lens = [int(x[0] * i / (mode_num + 1)) for i in reversed(range(1, mode_num + 1))]
-            simulator.simulate_preset(red_lens, green_lens, x[1:])
-        return -simulator.get_reward()
+    simulator.reset()
+    profiler = Profiler() if profile else None
+    if multi_fidelity:
+        f = MultiFidelityEvaluator(simulator, schedule_type, mode_num, num_cores=num_cores,
+                                   cache=cache, profiler=profiler)
+    else:
+        f = ParallelEvaluator(simulator, schedule_type, mode_num, num_cores=num_cores,
+                              cache=cache, profiler=profiler)
 
     input_dim = 0
     domain = []
@@ -109,20 +154,66 @@ def optimize(schedule_type, max_iter=300, mode_num=2):
                 'domain': list(range(mode_num))
             })
 
+    if multi_fidelity:
+        input_dim += 1
+        domain.append({
+            'name': 'fidelity',
+            'type': 'discrete',
+            'domain': list(range(len(f.fidelities)))
+        })
+
     kernel = GPy.kern.RBF(input_dim=input_dim, variance=1.0, lengthscale=4.0)
-    opt = BayesianOptimization(f=lambda X: np.apply_along_axis(f, 1, X),
-                               domain=domain, model_type='GP', initial_design_numdata=80,
-                               kernel=kernel, acquisition_type='EI')
+    # GPyOpt evaluates its own initial design one point at a time, so the
+    # initial design is drawn and simulated here in a single batch
+    start = time.perf_counter()
+    space = Design_space(domain)
+    X_init = initial_design('random', space, 80)
+    # Same model, acquisition and evaluator as BayesianOptimization builds
+    # for model_type='GP' and acquisition_type='EI', assembled here so that
+    # the objective can be given as is
+    model = GPModel(kernel=kernel, optimize_restarts=5, verbose=False)
+    acquisition_optimizer = AcquisitionOptimizer(space, 'lbfgs', model=model)
+    cost = CostModel(f.cost_withGradients if multi_fidelity else None)
+    acquisition = AcquisitionEI(model, space, acquisition_optimizer, cost.cost_withGradients)
+    if batch_size > 1:
+        evaluator = LocalPenalization(AcquisitionLP(model, space, acquisition_optimizer,
+                                                    acquisition), batch_size)
+    else:
+        evaluator = Sequential(acquisition)
+    opt = ModularBayesianOptimization(model, space, EvaluatorObjective(f), acquisition,
+                                      evaluator, X_init, Y_init=f(X_init), cost=cost)
     opt.run_optimization(max_iter=max_iter, max_time=600)
+    x_opt, fx_opt = opt.x_opt, opt.fx_opt
+    if multi_fidelity:
+        # opt.x_opt may have been evaluated at a lower fidelity only
+        x_opt, fx_opt = f.get_optimum(opt.X, opt.Y)
+    optimized = time.perf_counter()
+    f.close()
     if schedule_type in ['preset', 'forced_preset']:
-        opt.plot_convergence(f'../plots/{junction_num}_2/{schedule_type}_{mode_num}.png')
+        name = f'../plots/{junction_num}_2/{schedule_type}_{mode_num}'
     else:
-        opt.plot_convergence(f'../plots/{junction_num}_2/{schedule_type}.png')
-    print(opt.x_opt)
-    print(opt.fx_opt)
+        name = f'../plots/{junction_num}_2/{schedule_type}'
+    opt.plot_convergence(f'{name}.png')
+    if profile:
+        # Whatever the objective did not take in the optimization went to
+        # GPyOpt: fitting the GP and optimizing the acquisition
+        profiler.add_time('model', optimized - start - profiler.times['objective'])
+        profiler.add_time('plot', time.perf_counter() - optimized)
+        profiler.dump(f'{name}_profile.json')
+        session_profiler.merge(profiler)
+    print(x_opt)
+    print(fx_opt)
+    if block_coordinate and schedule_type == 'distinct':
+        x = x_opt[:2 * junction_num]
+        x, reward = BlockCoordinateOptimizer(simulator).optimize(x, sweeps=3)
+        print(x)
+        print(-reward)
 
 
 for schedule_type in schedule_options:
     optimize(schedule_type)
     if schedule_type in ['preset', 'forced_preset']:
         optimize(schedule_type, mode_num=5)
+if profile:
+    session_profiler.dump(f'../plots/{junction_num}_2/profile.json')
+    print(session_profiler)
@@ -3,8 +3,12 @@ import random
 import numpy as np
 import GPy
 
+from GPyOpt.core.task.space import Design_space
+from GPyOpt.experiment_design import initial_design
 from GPyOpt.methods import BayesianOptimization
 
+from emulation.cache import EvaluationCache
+from emulation.parallel import ParallelEvaluator
 from simulation.simulator import Simulator
 
 random.seed(42)
@@ -12,12 +16,21 @@ network_options = ['text', 'random', 'ring']
 network_type = 'random'
 junction_num = 40
 car_num = 100
+# Set to False to reproduce the results in plots/ (last-in-first-out queues)
+fifo = True
+# Set to True to reproduce the networks of plots/, drawn from random one
+# object at a time rather than from NetworkArrays
+legacy_network = False
+# Rewards already simulated, shared with emulator.py
+cache = EvaluationCache('../data/evaluations.sqlite3')
 
-simulator = Simulator()
+simulator = Simulator(fifo=fifo)
 if network_type == 'random':
-    simulator.initialize_random_network(junction_num=junction_num, car_num=car_num)
+    simulator.initialize_random_network(junction_num=junction_num, car_num=car_num,
+                                        legacy=legacy_network)
 elif network_type == 'random_ring':
-    simulator.initialize_random_ring(junction_num=junction_num, car_num=car_num)
+    simulator.initialize_random_ring(junction_num=junction_num, car_num=car_num,
+                                     legacy=legacy_network)
 elif network_type == 'text':
     simulator.initialize_from_text('../data/f.txt')
     junction_num = len(simulator.network.junctions)
@@ -26,35 +39,31 @@ else:
 
 
 def optimize(max_iter=300, mode_num=3):
-    def f1(x):
-        simulator.reset()
-        x = list(map(int, x))
-        red_lens = range(1, mode_num + 1)
-        green_lens = list(reversed(red_lens))
-        simulator.simulate_preset(red_lens, green_lens, x)
-        return -simulator.get_reward()
+    simulator.reset()
+    f = ParallelEvaluator(simulator, 'preset', mode_num, cache=cache)
+
+    def f1(X):
+        red_lens = np.tile(range(1, mode_num + 1), (len(X), 1))
+        green_lens = red_lens[:, ::-1]
+        return f(np.hstack([red_lens, green_lens, X]))
 
     domain = [{
         'name': f'mode_{i}',
         'type': 'discrete',
         'domain': range(0, mode_num)
     } for i in range(junction_num)]
-    opt1 = BayesianOptimization(f=lambda X: np.apply_along_axis(f1, 1, X),
-                                domain=domain, model_type='sparseGP', initial_design_numdata=80,
+    X_init = initial_design('random', Design_space(domain), 80)
+    opt1 = BayesianOptimization(f=f1, domain=domain, model_type='sparseGP',
+                                X=X_init, Y=f1(X_init),
                                 acquisition_type='EI')
     opt1.run_optimization(max_iter=max_iter, max_time=300)
     opt1.plot_convergence()
     print(opt1.x_opt)
     print(opt1.fx_opt)
 
-    def f2(x):
-        simulator.reset()
-        x = list(map(int, x))
-        mode = list(map(int, opt1.x_opt))
-        red_lens = x[::2]
-        green_lens = x[1::2]
-        simulator.simulate_preset(red_lens, green_lens, mode)
-        return -simulator.get_reward()
+    def f2(X):
+        mode = np.tile(opt1.x_opt, (len(X), 1))
+        return f(np.hstack([X[:, ::2], X[:, 1::2], mode]))
 
     domain = []
     for i in range(mode_num):
@@ -68,13 +77,15 @@ def optimize(max_iter=300, mode_num=3):
             'type': 'discrete',
             'domain': range(1, 60)
         })
-    opt2 = BayesianOptimization(f=lambda X: np.apply_along_axis(f2, 1, X),
-                                domain=domain, model_type='GP', initial_design_numdata=80,
+    X_init = initial_design('random', Design_space(domain), 80)
+    opt2 = BayesianOptimization(f=f2, domain=domain, model_type='GP',
+                                X=X_init, Y=f2(X_init),
                                 acquisition_type='EI')
     opt2.run_optimization(max_iter=max_iter, max_time=300)
     opt2.plot_convergence()
     print(opt2.x_opt)
     print(opt2.fx_opt)
+    f.close()
 
 
 optimize()
@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+
+from emulation.cache import EvaluationCache
+from emulation.parallel import ParallelEvaluator
+from simulation.profiler import Profiler
+from simulation.simulator import Simulator
+
+# From cheapest to full fidelity
+DEFAULT_FIDELITIES = [dict(horizon=0.25, car_fraction=0.25, tick_size=2),
+                      dict(horizon=0.5, car_fraction=0.5),
+                      dict()]
+
+
+class MultiFidelityEvaluator:
+    """
+    Objective for the emulators whose last input is the index of the fidelity
+    at which to simulate the candidate (see Simulator.get_fidelity), so that
+    candidates can be screened cheaply before being simulated in full. The
+    rewards of each fidelity are multiplied by its reward_scale.
+
+    The cost of a fidelity is the mean time it took per candidate so far.
+    Until it has been measured, it is extrapolated from a measured fidelity
+    (or from the full one if none has been) in proportion to
+    horizon * car_fraction / tick_size.
+
+    Attributes
+    ----------
+    fidelities: keyword arguments of Simulator.get_fidelity for each fidelity
+    evaluators: ParallelEvaluator of each fidelity
+    cost: measured seconds per candidate at each fidelity, nan if not measured
+    profiler: profiler shared by the evaluators, which also counts the
+              candidates of each fidelity, if any
+    """
+
+    def __init__(self, simulator: Simulator, schedule_type='uniform', mode_num=2,
+                 fidelities=None, num_cores=1, cache: EvaluationCache = None,
+                 profiler: Profiler = None):
+        self.fidelities = fidelities or DEFAULT_FIDELITIES
+        self.evaluators = [ParallelEvaluator(simulator.get_fidelity(**fidelity), schedule_type,
+                                             mode_num, num_cores, cache, profiler)
+                           for fidelity in self.fidelities]
+        self.profiler = profiler
+        self.cost = np.full(len(self.fidelities), np.nan)
+        self._time = np.zeros(len(self.fidelities))
+        self._count = np.zeros(len(self.fidelities), dtype=np.int64)
+        self._nominal_cost = np.array([fidelity.get('horizon', 1.0)
+                                       * fidelity.get('car_fraction', 1.0)
+                                       / fidelity.get('tick_size', 1)
+                                       for fidelity in self.fidelities])
+
+    def __call__(self, X):
+        return self.evaluate(X)[0]
+
+    def evaluate(self, X):
+        """ Same interface as GPyOpt's SingleObjective.evaluate """
+        X = np.atleast_2d(X)
+        fidelity = X[:, -1].astype(np.int64)
+        f_evals = np.zeros((len(X), 1))
+        cost_evals = np.zeros((len(X), 1))
+        for i in np.unique(fidelity).tolist():
+            rows = fidelity == i
+            evaluator = self.evaluators[i]
+            start = time.time()
+            f_evals[rows] = evaluator(X[rows, :-1]) * evaluator.snapshot.reward_scale
+            elapsed = time.time() - start
+            cost_evals[rows] = elapsed / rows.sum()
+            self._time[i] += elapsed
+            self._count[i] += rows.sum()
+            self.cost[i] = self._time[i] / self._count[i]
+            if self.profiler is not None:
+                self.profiler.count(f'evaluations_fidelity_{i}', int(rows.sum()))
+        return f_evals, cost_evals
+
+    def get_cost(self, X):
+        """ Expected seconds to evaluate each row of X """
+        cost = self.cost
+        if np.isnan(cost).any():
+            measured = np.flatnonzero(self._count)
+            reference = measured[np.argmax(self._count[measured])] if len(measured) else -1
+            scale = cost[reference] / self._nominal_cost[reference] if len(measured) else 1.0
+            cost = np.where(np.isnan(cost), self._nominal_cost * scale, cost)
+        return cost[np.atleast_2d(X)[:, -1].astype(np.int64)].reshape(-1, 1)
+
+    def cost_withGradients(self, X):
+        """ Cost of each row of X, in the form of GPyOpt's cost_withGradients """
+        X = np.atleast_2d(X)
+        return self.get_cost(X), np.zeros(X.shape)
+
+    def get_optimum(self, X, Y, top=5):
+        """
+        Best of the candidates X with objective values Y at full fidelity.
+        Values from lower fidelities are not comparable with full ones, so
+        the top lowest-valued of those candidates are re-simulated in full
+        and compete with the candidates already evaluated in full
+        """
+        X, Y = np.atleast_2d(X), np.asarray(Y).reshape(-1)
+        full = len(self.fidelities) - 1
+        is_full = X[:, -1].astype(np.int64) == full
+        screened = np.flatnonzero(~is_full)
+        screened = screened[np.argsort(Y[screened], kind='stable')[:top]]
+        X_full, Y_full = X[is_full], Y[is_full]
+        if len(screened):
+            X_screened = X[screened].copy()
+            X_screened[:, -1] = full
+            X_full = np.vstack([X_full, X_screened])
+            Y_full = np.concatenate([Y_full, self.evaluate(X_screened)[0].ravel()])
+        best = np.argmin(Y_full)
+        return X_full[best], Y_full[best]
+
+    def close(self):
+        for evaluator in self.evaluators:
+            evaluator.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
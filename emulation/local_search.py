@@ -0,0 +1,136 @@
+import math
+import random
+import time
+
+import numpy as np
+
+from simulation.schedule import PeriodicSchedule
+from simulation.scoring import IncrementalHashCodeScorer
+
+
+class LocalSearch:
+    """
+    Hill climbing, or simulated annealing if given a temperature, over the
+    durations of the periodic schedules of a Hash Code input
+
+    Each step changes the schedule of a single junction, either the duration
+    of one of its roads or, since a PeriodicSchedule gives green to the roads
+    in the order of in_rds, which roads get two of its durations. The step is
+    re-scored incrementally (see IncrementalHashCodeScorer), kept if it does
+    not lower the score (or by the Metropolis rule when annealing) and
+    undone otherwise. Only the roads that some car queues on are given
+    green, and only junctions with at least two of them are changed, since
+    no other schedule makes a difference.
+
+    Attributes
+    ----------
+    scorer: incremental scorer of the input
+    max_duration: longest duration a road can be given
+    temperature: starting temperature, decreasing linearly to 0 over the
+                 iterations (0 for hill climbing)
+    durations: durations of the current schedules, one list per junction
+    score: score of the current schedules
+    best_durations: durations of the best schedules found
+    best_score: score of the best schedules found
+    evaluations: number of steps scored
+    accepted: number of steps kept
+    """
+
+    def __init__(self, scorer: IncrementalHashCodeScorer, max_duration=10, temperature=0,
+                 seed=0):
+        self.scorer = scorer
+        self.max_duration = max_duration
+        self.temperature = temperature
+        self.durations = None
+        self.score = None
+        self.best_durations = None
+        self.best_score = None
+        self.evaluations = 0
+        self.accepted = 0
+        self._rng = random.Random(seed)
+
+        text_input = scorer.text_input
+        queued = np.zeros(text_input.road_num, dtype=bool)
+        queued[text_input.route_roads[np.setdiff1d(np.arange(len(text_input.route_roads)),
+                                                   text_input.route_offsets[1:] - 1)]] = True
+        slot_queued = [queued[roads].tolist() for roads in scorer.junction_rds]
+        # Positions among in_rds of the roads that cars queue on, per junction
+        self._slots = [[i for i, used in enumerate(used_slots) if used]
+                       for used_slots in slot_queued]
+        self._junctions = [i for i, slots in enumerate(self._slots) if len(slots) > 1]
+
+    @staticmethod
+    def from_text(filepath, max_duration=10, temperature=0, seed=0):
+        return LocalSearch(IncrementalHashCodeScorer.from_text(filepath), max_duration,
+                           temperature, seed)
+
+    def get_initial_durations(self):
+        """ One second of green for every road that cars queue on, none for the others """
+        durations = []
+        for roads, slots in zip(self.scorer.junction_rds, self._slots):
+            duration = [0] * len(roads)
+            for i in slots:
+                duration[i] = 1
+            if not slots:
+                duration = [1] * max(len(roads), 1)
+            durations.append(duration)
+        return durations
+
+    def _mutate(self, junction):
+        """ New durations for junction, differing from the current ones in one step """
+        rng = self._rng
+        slots = self._slots[junction]
+        duration = list(self.durations[junction])
+        i, j = rng.sample(slots, 2)
+        if duration[i] != duration[j] and rng.random() < 0.5:
+            duration[i], duration[j] = duration[j], duration[i]
+            return duration
+        while True:
+            new = duration[i] + rng.choice([-1, 1]) * rng.randint(1, 2)
+            new = min(max(new, 0), self.max_duration)
+            if new != duration[i] and (new or sum(duration) > duration[i]):
+                duration[i] = new
+                return duration
+
+    def optimize(self, durations=None, iterations=10000, max_time=None):
+        """
+        Improve the durations (get_initial_durations by default) for the given
+        number of steps or seconds, and return the best schedules found with
+        their score
+        """
+        scorer = self.scorer
+        rng = self._rng
+        self.durations = [list(duration) for duration in
+                          (durations or self.get_initial_durations())]
+        self.score = scorer.score([PeriodicSchedule(duration) for duration in self.durations])
+        self.best_durations = [list(duration) for duration in self.durations]
+        self.best_score = self.score
+        if not self._junctions:
+            return scorer.schedules, self.score
+
+        start = time.perf_counter()
+        for iteration in range(iterations):
+            if max_time is not None and time.perf_counter() - start > max_time:
+                break
+            junction = rng.choice(self._junctions)
+            duration = self._mutate(junction)
+            score = scorer.update(junction, PeriodicSchedule(duration))
+            self.evaluations += 1
+
+            temperature = self.temperature * (1 - iteration / iterations)
+            if score >= self.score or (temperature > 0 and
+                                       rng.random() < math.exp((score - self.score) / temperature)):
+                self.durations[junction] = duration
+                self.score = score
+                self.accepted += 1
+                if self.temperature == 0:
+                    # Hill climbing never moves to lower scores
+                    self.best_durations[junction] = duration
+                    self.best_score = score
+                elif score > self.best_score:
+                    self.best_durations = [list(duration) for duration in self.durations]
+                    self.best_score = score
+            else:
+                scorer.undo()
+
+        return [PeriodicSchedule(duration) for duration in self.best_durations], self.best_score
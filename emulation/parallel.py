@@ -0,0 +1,122 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from emulation.cache import EvaluationCache
+from simulation.engine import VectorizedSimulator
+from simulation.profiler import Profiler
+from simulation.simulator import Simulator
+
+# Compiled simulator of a worker process, set once by _init_worker
+_worker_simulator = None
+
+
+def _init_worker(snapshot):
+    global _worker_simulator
+    _worker_simulator = snapshot
+    # Profiles of the workers would be lost with them
+    _worker_simulator.profiler = None
+
+
+def _evaluate_chunk(X, schedule_type, mode_num):
+    return _worker_simulator.simulate_batch(X, schedule_type, mode_num)
+
+
+class ParallelEvaluator:
+    """
+    Objective for the emulators that evaluates candidate schedules on a pool
+    of worker processes
+
+    The network and cars are compiled once into a VectorizedSimulator (unless
+    the simulator already is one, which is then used as is), whose compact
+    picklable snapshot is sent to every worker when the pool starts.
+    Each call splits the candidate rows into one chunk per worker, simulates
+    every chunk as a batch, and returns the negated rewards in input order.
+    Every candidate starts from the state the simulator was in when the
+    evaluator was created, so the results only depend on how the network
+    and cars were generated (i.e. on the seed), not on the number of cores.
+
+    Candidates are cast to integers before they are simulated, so distinct
+    candidates often share a schedule: each one is simulated only once per
+    call, and not at all if it is found in the cache.
+
+    Attributes
+    ----------
+    schedule_type: encoding of the candidates (see Simulator.get_schedules)
+    mode_num: number of preset modes
+    num_cores: number of worker processes, evaluates in-process if 1
+    cache: cache of rewards checked before simulating, if any
+    fingerprint: fingerprint of the snapshot, under which rewards are cached
+    profiler: profiler that the calls (phase objective, and the simulations
+              when evaluating in-process) are timed and counted on, if any
+    """
+
+    def __init__(self, simulator: Simulator, schedule_type='uniform', mode_num=2,
+                 num_cores=1, cache: EvaluationCache = None, profiler: Profiler = None):
+        self.schedule_type = schedule_type
+        self.mode_num = mode_num
+        self.num_cores = num_cores
+        self.cache = cache
+        if isinstance(simulator, VectorizedSimulator):
+            self.snapshot = simulator
+        else:
+            self.snapshot = VectorizedSimulator.from_simulator(simulator)
+        self.fingerprint = self.snapshot.get_fingerprint()
+        self.profiler = profiler
+        if profiler is not None:
+            self.snapshot.profiler = profiler
+        self._pool = None
+
+    def __call__(self, X):
+        start = time.perf_counter()
+        params, inverse = np.unique(EvaluationCache.get_params(X), axis=0, return_inverse=True)
+        simulated = len(params)
+        if self.cache is None:
+            rewards = self._simulate(params)
+        else:
+            rewards, found = self.cache.get(self.fingerprint, self.schedule_type,
+                                            self.mode_num, params)
+            simulated = int((~found).sum())
+            if not found.all():
+                rewards[~found] = self._simulate(params[~found])
+                self.cache.put(self.fingerprint, self.schedule_type, self.mode_num,
+                               params[~found], rewards[~found])
+        if self.profiler is not None:
+            self.profiler.add_time('objective', time.perf_counter() - start)
+            self.profiler.count('evaluations', len(X))
+            self.profiler.count('simulations', simulated)
+        return -rewards[inverse.ravel()].reshape(-1, 1)
+
+    def _simulate(self, X):
+        if self.num_cores == 1 or len(X) == 1:
+            return self.snapshot.simulate_batch(X, self.schedule_type, self.mode_num)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.num_cores,
+                                             initializer=_init_worker,
+                                             initargs=(self.snapshot,))
+        chunks = np.array_split(X, min(self.num_cores, len(X)))
+        return np.concatenate(list(self._pool.map(
+            _evaluate_chunk, chunks,
+            [self.schedule_type] * len(chunks), [self.mode_num] * len(chunks))))
+
+    def evaluate(self, X):
+        """
+        Same interface as GPyOpt's SingleObjective.evaluate, so that batches
+        suggested by BayesianOptimization are evaluated here in parallel
+        """
+        start = time.time()
+        f_evals = self(X)
+        cost_evals = np.full((len(f_evals), 1), (time.time() - start) / len(f_evals))
+        return f_evals, cost_evals
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
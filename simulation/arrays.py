@@ -0,0 +1,190 @@
+import hashlib
+
+import numpy as np
+
+from simulation.junction import Junction
+from simulation.network import Network
+from simulation.road import Road
+
+
+class NetworkArrays:
+    """
+    Road network stored as edge arrays, with junctions numbered from 0 to
+    junction_num - 1 and roads numbered in the order they are listed. The
+    generators take a numpy.random.Generator and run in linear time, so they
+    scale to millions of junctions; to_network builds the Junction and Road
+    objects, and VectorizedSimulator.load_arrays compiles the arrays as they
+    are.
+
+    Attributes
+    ----------
+    junction_num: number of junctions
+    road_origin: starting junction of each road
+    road_exit: ending junction of each road
+    road_length: length of each road
+    """
+
+    def __init__(self, junction_num, road_origin, road_exit, road_length):
+        self.junction_num = junction_num
+        self.road_origin = road_origin
+        self.road_exit = road_exit
+        self.road_length = road_length
+
+    @property
+    def road_num(self):
+        return len(self.road_length)
+
+    @staticmethod
+    def from_network(network: Network):
+        junction_ids = {junction: i for i, junction in enumerate(network.junctions)}
+        return NetworkArrays(
+            len(network.junctions),
+            np.array([junction_ids[road.origin] for road in network.roads], dtype=np.int64),
+            np.array([junction_ids[road.exit] for road in network.roads], dtype=np.int64),
+            np.array([road.length for road in network.roads], dtype=np.int64))
+
+    def to_network(self, road_names=None):
+        """
+        Build the Junction and Road objects, named as by the Network generators
+        unless road names are given
+        """
+        junctions = [Junction(name=f'junction_{i}') for i in range(self.junction_num)]
+        origins = [junctions[i] for i in self.road_origin.tolist()]
+        exits = [junctions[i] for i in self.road_exit.tolist()]
+        if road_names is None:
+            road_names = [f'{origin.name}_{exit.name}' for origin, exit in zip(origins, exits)]
+        roads = [Road(name, length, origin, exit) for name, origin, exit, length
+                 in zip(road_names, origins, exits, self.road_length.tolist())]
+        # Fill in_rds and out_rds in bulk, in the order the roads are listed
+        # (their indices are built the first time they are needed)
+        for rds_attr, ends in [('in_rds', self.road_exit), ('out_rds', self.road_origin)]:
+            order = np.argsort(ends, kind='stable')
+            bounds = np.searchsorted(ends[order], np.arange(self.junction_num + 1)).tolist()
+            order = list(map(roads.__getitem__, order.tolist()))
+            for i, junction in enumerate(junctions):
+                setattr(junction, rds_attr, order[bounds[i]:bounds[i + 1]])
+        return Network(junctions, roads)
+
+    def get_fingerprint(self):
+        """ Hash of the junction number and the road arrays """
+        digest = hashlib.sha1(np.array([self.junction_num], dtype=np.int64).tobytes())
+        for array in [self.road_origin, self.road_exit, self.road_length]:
+            digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def get_out_adjacency(self):
+        """ Roads out of each junction in CSR form: offsets, and road ids by origin """
+        out_roads = np.argsort(self.road_origin, kind='stable')
+        out_offsets = np.zeros(self.junction_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.road_origin, minlength=self.junction_num),
+                  out=out_offsets[1:])
+        return out_offsets, out_roads
+
+    def generate_routes(self, car_num, rng: np.random.Generator, road_num=10):
+        """
+        Random walks of road_num roads, as by Car.gen_route: each starts on a
+        random road, and moves on to a random road out of the junction it
+        reaches, stopping early at junctions with no road out. All cars take
+        each step at once. Returns the routes in CSR form: the start of each
+        car's route in the second array, which holds all road ids.
+        """
+        out_offsets, out_roads = self.get_out_adjacency()
+        out_degree = np.diff(out_offsets)
+        routes = np.empty((car_num, road_num), dtype=np.int64)
+        route_len = np.full(car_num, road_num, dtype=np.int64)
+        routes[:, 0] = rng.integers(0, self.road_num, car_num)
+        walking = np.arange(car_num)
+        for i in range(1, road_num):
+            junction = self.road_exit[routes[walking, i - 1]]
+            degree = out_degree[junction]
+            stuck = degree == 0
+            route_len[walking[stuck]] = i
+            walking = walking[~stuck]
+            junction = junction[~stuck]
+            choice = (rng.random(len(walking)) * degree[~stuck]).astype(np.int64)
+            routes[walking, i] = out_roads[out_offsets[junction] + choice]
+
+        route_offsets = np.zeros(car_num + 1, dtype=np.int64)
+        np.cumsum(route_len, out=route_offsets[1:])
+        route_roads = routes[np.arange(road_num) < route_len[:, None]]
+        return route_offsets, route_roads
+
+    @staticmethod
+    def generate_random(junction_num, rng: np.random.Generator, max_road_length=5,
+                        allow_cyclic=True):
+        """
+        Every junction gets two roads in, as in Network.generate_random_network:
+        one from a junction that has no road out yet (taken in a random order,
+        so that every junction gets a road out) and one from a junction that
+        already has one. The first junction gets two of the former, and the
+        last one two of the latter.
+        """
+        # Every junction needs two distinct origins (other than itself if
+        # not allow_cyclic)
+        assert junction_num >= (2 if allow_cyclic else 3)
+        exits = np.arange(junction_num, dtype=np.int64)
+        order = rng.permutation(junction_num)
+        if not allow_cyclic:
+            # Move junctions that would get a road into themselves elsewhere
+            # in the order (there is about one such junction on average)
+            new_at = np.concatenate([[0], np.arange(junction_num - 1)])
+            while True:
+                loops = np.flatnonzero(order == new_at)
+                if len(loops) == 0:
+                    break
+                for i in loops.tolist():
+                    j = rng.integers(junction_num)
+                    order[i], order[j] = order[j], order[i]
+
+        # Junction i takes the (i + 1)-th new origin, and one of the i + 1
+        # origins taken before it
+        new_origin = np.empty(junction_num, dtype=np.int64)
+        new_origin[0] = order[0]
+        new_origin[1:-1] = order[2:]
+        new_origin[-1] = -1
+        taken = np.arange(1, junction_num + 1)
+        taken[0] = 0
+        old_origin = np.full(junction_num, -1, dtype=np.int64)
+        old_origin[0] = order[1]
+        pending = np.arange(1, junction_num)
+        while len(pending):
+            old_origin[pending] = order[rng.integers(0, taken[pending])]
+            clash = old_origin[pending] == new_origin[pending]
+            if not allow_cyclic:
+                clash |= old_origin[pending] == exits[pending]
+            pending = pending[clash]
+
+        # The last junction has no new origin left, and takes two old ones
+        last = junction_num - 1
+        while True:
+            new_origin[last] = order[rng.integers(junction_num)]
+            if new_origin[last] != old_origin[last] \
+                    and (allow_cyclic or new_origin[last] != last):
+                break
+
+        road_origin = np.stack([new_origin, old_origin], axis=1).ravel()
+        road_exit = np.repeat(exits, 2)
+        road_length = rng.integers(1, max_road_length + 1, len(road_exit))
+        return NetworkArrays(junction_num, road_origin, road_exit, road_length)
+
+    @staticmethod
+    def generate_ring(junction_num, rng: np.random.Generator, max_road_length=5):
+        """ Every junction gets a road in from each of its two neighbours on a ring """
+        exits = np.arange(junction_num, dtype=np.int64)
+        road_origin = np.stack([(exits - 1) % junction_num, (exits + 1) % junction_num],
+                               axis=1).ravel()
+        road_exit = np.repeat(exits, 2)
+        road_length = rng.integers(1, max_road_length + 1, len(road_exit))
+        return NetworkArrays(junction_num, road_origin, road_exit, road_length)
+
+    @staticmethod
+    def generate_k_in(junction_num, k, rng: np.random.Generator, max_road_length=5):
+        """
+        Every junction gets k roads in, from junctions drawn uniformly (with
+        replacement) among the others
+        """
+        exits = np.repeat(np.arange(junction_num, dtype=np.int64), k)
+        road_origin = rng.integers(0, junction_num - 1, len(exits))
+        road_origin += road_origin >= exits
+        road_length = rng.integers(1, max_road_length + 1, len(exits))
+        return NetworkArrays(junction_num, road_origin, exits, road_length)
@@ -1,13 +1,60 @@
 from __future__ import annotations
 
 import random
-from typing import List, TYPE_CHECKING
+from array import array
+from collections.abc import Sequence as SequenceABC
+from typing import List, Sequence, TYPE_CHECKING
+
+import numpy as np
 
 if TYPE_CHECKING:
     from simulation.network import Network
     from simulation.road import Road
 
 
+class RouteView(SequenceABC):
+    """
+    Read-only sequence of the roads of a route held as road ids in a shared
+    array, which looks the roads up only when they are accessed
+
+    Attributes
+    ----------
+    roads: roads that the ids index
+    road_ids: array of road ids that the route is a slice of
+    start: position of the first road of the route in road_ids
+    """
+
+    __slots__ = ['roads', 'road_ids', 'start', '_len']
+
+    def __init__(self, roads: List[Road], road_ids, start, length):
+        self.roads = roads
+        self.road_ids = road_ids
+        self.start = start
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self[j] for j in range(*i.indices(self._len)))
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('route index out of range')
+        return self.roads[self.road_ids[self.start + i]]
+
+    def __iter__(self):
+        return map(self.roads.__getitem__, self.road_ids[self.start:self.start + self._len])
+
+    def __eq__(self, other):
+        return isinstance(other, SequenceABC) and len(self) == len(other) \
+            and all(a is b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f'RouteView({list(self)})'
+
+
 class Car:
     """
     Class representing individual cars
@@ -17,32 +64,90 @@ class Car:
     name: name of the car
     idx: index of the car's current road on the route
     dist: how far on the road the car has travelled
-    route: the route taken by the car
+    route: the route taken by the car, as a read-only sequence of roads: it
+           cannot be modified in place, but can be assigned (and is then
+           kept as a tuple). Cars built by from_routes share one array of
+           road ids instead, seen through a RouteView.
     """
 
-    def __init__(self, name, route: List[Road] = None):
+    __slots__ = ['name', 'idx', 'dist', 'reward', '_roads', '_road_ids', '_start', '_len']
+
+    def __init__(self, name, route: Sequence[Road] = None):
         self.name = name
         self.idx = 0
         self.dist = 0
-        self.route = route or []
+        self.route = route or ()
         self.reward = 0
 
+    @staticmethod
+    def from_routes(roads: List[Road], route_offsets, route_roads, names=None) -> List[Car]:
+        """
+        Cars on routes given in CSR form, as indices into roads: car i takes
+        route_roads[route_offsets[i]:route_offsets[i + 1]]. The cars share a
+        single compact copy of route_roads rather than holding a list each.
+        """
+        road_ids = array('i', np.asarray(route_roads, dtype=np.int32).tobytes())
+        offsets = np.asarray(route_offsets).tolist()
+        names = names if names is not None else range(len(offsets) - 1)
+        cars = []
+        for name, start, end in zip(names, offsets[:-1], offsets[1:]):
+            car = Car.__new__(Car)
+            car.name = name
+            car.idx = 0
+            car.dist = 0
+            car.reward = 0
+            car._roads = roads
+            car._road_ids = road_ids
+            car._start = start
+            car._len = end - start
+            cars.append(car)
+        return cars
+
+    @property
+    def route(self) -> Sequence[Road]:
+        if self._road_ids is None:
+            return self._roads
+        return RouteView(self._roads, self._road_ids, self._start, self._len)
+
+    @route.setter
+    def route(self, route: Sequence[Road]):
+        self._roads = tuple(route)
+        self._road_ids = None
+        self._start = 0
+        self._len = 0
+
     def get_road(self):
-        return self.route[self.idx]
+        if self._road_ids is None:
+            return self._roads[self.idx]
+        return self._roads[self._road_ids[self._start + self.idx]]
+
+    def get_next_road(self):
+        """ Road after the current one on the route, None if it is the last """
+        if self.idx + 1 >= self.get_route_len():
+            return None
+        if self._road_ids is None:
+            return self._roads[self.idx + 1]
+        return self._roads[self._road_ids[self._start + self.idx + 1]]
+
+    def get_route_len(self):
+        if self._road_ids is None:
+            return len(self._roads)
+        return self._len
 
     def tick(self):
         """ Advance on a road """
-        if self.idx < len(self.route):
-            if self.dist < self.get_road().length:
+        if self.idx < self.get_route_len():
+            road = self.get_road()
+            if self.dist < road.length:
                 self.dist += 1
-                if self.dist == self.get_road().length:
-                    self.get_road().enqueue(self)
+                if self.dist == road.length:
+                    road.enqueue(self)
                 self.reward += 1
 
     def advance(self):
         """ Advance past a junction """
         self.idx += 1
-        if self.idx < len(self.route):
+        if self.idx < self.get_route_len():
             self.dist = 0
 
     def reset(self):
@@ -51,20 +156,22 @@ class Car:
         self.reward = 0
 
     def gen_route(self, network: Network, road_num=10):
-        if not self.route:
+        route = list(self.route)
+        if not route:
             road = random.choice(network.roads)
             self.dist = road.length
-            self.route.append(road)
+            route.append(road)
             road_num -= 1
 
-        road = self.get_road()
+        road = route[self.idx]
 
         for i in range(road_num):
             if not road.exit.out_rds:
                 break
             road = random.choice(road.exit.out_rds)
-            self.route.append(road)
+            route.append(road)
 
+        self.route = route
         return self
 
     def __str__(self):
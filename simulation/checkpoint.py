@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+from simulation.car import Car
+from simulation.engine import VectorizedSimulator
+from simulation.network import Network
+from simulation.schedule import PeriodicSchedule
+
+
+class CheckpointSimulator(VectorizedSimulator):
+    """
+    Simulator that records its state every few ticks, and resumes a new
+    schedule from the latest checkpoint of a previously simulated schedule
+    that is guaranteed to be identical for both
+
+    Two runs from the same initial state stay identical until a junction
+    whose schedule changed dequeues differently, i.e. gives green to another
+    road while the road it used to (or now) gives green to has cars queued.
+    A change can only propagate from there, so the first tick at which that
+    can happen bounds how long the checkpoints of the old schedule stay
+    valid. To know it, every run also records the first tick at which each
+    road had a car queued. This suits local search, where most candidates
+    differ from a recent one at only a few junctions.
+
+    Checkpoints are only recorded and used when simulate is called from the
+    initial state (i.e. straight after reset).
+
+    Attributes
+    ----------
+    interval: number of ticks between checkpoints, sim_len // 16 by default
+    cache_size: number of schedules whose checkpoints are kept (least
+                recently used ones are evicted first)
+    resumed_at: tick from which the last simulate resumed
+    """
+
+    def __init__(self, network: Network = None, cars: List[Car] = None, sim_len=100,
+                 fifo=True, interval=None, cache_size=16):
+        super().__init__(network, cars, sim_len, fifo)
+        self.interval = interval
+        self.cache_size = cache_size
+        self.resumed_at = 0
+        self._cache = OrderedDict()
+        self._at_initial_state = False
+        self._first_queued = None
+
+    def compile(self):
+        super().compile()
+        self._cache.clear()
+
+    def load_text(self, filepath, use_cache=True):
+        super().load_text(filepath, use_cache)
+        self._cache.clear()
+
+    def reset(self):
+        super().reset()
+        self._at_initial_state = True
+
+    def restore(self, state):
+        super().restore(state)
+        self._at_initial_state = False
+
+    def simulate_controlled(self, controller):
+        super().simulate_controlled(controller)
+        self._at_initial_state = False
+
+    def _enqueue(self, cars, roads):
+        super()._enqueue(cars, roads)
+        if self._first_queued is not None and len(roads):
+            # Cars enqueued at this tick can be dequeued from the next one
+            np.minimum.at(self._first_queued, roads, self.clock + 1)
+
+    def _get_green(self, table, t, in_rds, first_queued):
+        """
+        in_rds index given green by table at each tick of t (-1 for none if
+        the table is empty), and the first tick that road had cars queued
+        """
+        if len(table) == 0:
+            return np.full(len(t), -1), np.full(len(t), self.sim_len)
+        green = table[t % len(table)]
+        # Index -1 is the last in-road (see util.get_bin_idx)
+        green = np.where(green < 0, green + len(in_rds), green)
+        return green, first_queued[in_rds[green]]
+
+    def _get_divergence(self, key, tables, cached_key, cached_tables, first_queued):
+        """
+        First tick at which a junction with a different schedule may dequeue
+        differently, given the first tick each road had cars queued
+        """
+        divergence = self.sim_len
+        for i in range(self.junction_num):
+            if key[i] == cached_key[i] or self.in_degree[i] == 0:
+                continue
+            # A junction's only road is always green, unless there are no phases
+            if self.in_degree[i] == 1 and len(tables[i]) and len(cached_tables[i]):
+                continue
+            in_rds = self.in_rd_matrix[i, :self.in_degree[i]]
+            if first_queued[in_rds].min() >= divergence:
+                continue
+            t = np.arange(divergence)
+            green, green_queued = self._get_green(tables[i], t, in_rds, first_queued)
+            cached_green, cached_queued = self._get_green(cached_tables[i], t, in_rds,
+                                                          first_queued)
+            queued = np.minimum(green_queued, cached_queued) <= t
+            different = np.flatnonzero((green != cached_green) & queued)
+            if len(different):
+                divergence = int(different[0])
+                if divergence == 0:
+                    break
+        return divergence
+
+    def simulate(self, schedules):
+        self._ensure_compiled()
+        schedules = [schedules[i] for i in range(self.junction_num)]
+        # Runs resumed from a checkpoint would miss the samples before it
+        if not self._at_initial_state or self.metrics is not None \
+                or not all(isinstance(schedule, PeriodicSchedule) for schedule in schedules):
+            super().simulate(schedules)
+            return
+        self._at_initial_state = False
+
+        key = tuple(schedule.get_key() for schedule in schedules)
+        tables = [schedule.table for schedule in schedules]
+        interval = self.interval or max(1, self.sim_len // 16)
+
+        # Find the cached schedule whose checkpoints stay valid the longest
+        start, checkpoints, parent_key = 0, {}, None
+        first_queued = np.full(self.road_num, self.sim_len, dtype=np.int64)
+        for cached_key, (cached_tables, cached_checkpoints, cached_first_queued) \
+                in reversed(self._cache.items()):
+            divergence = self._get_divergence(key, tables, cached_key, cached_tables,
+                                              cached_first_queued)
+            valid = [t for t in cached_checkpoints if t <= divergence]
+            if valid and max(valid) > start:
+                start = max(valid)
+                checkpoints = {t: cached_checkpoints[t] for t in valid}
+                first_queued = np.where(cached_first_queued < start, cached_first_queued,
+                                        self.sim_len)
+                parent_key = cached_key
+            if start >= self.sim_len:
+                break
+        if parent_key is not None:
+            self._cache.move_to_end(parent_key)
+            self.restore(checkpoints[start])
+        first_queued[self.top >= 0] = np.minimum(first_queued[self.top >= 0], start)
+
+        if self.network is not None:
+            for i in range(self.junction_num):
+                self.network.junctions[i].schedule = schedules[i]
+        self._set_schedules([schedules])
+        self.resumed_at = start
+        self._first_queued = first_queued
+        for self.clock in range(start, self.sim_len):
+            if self.clock % interval == 0 and self.clock not in checkpoints:
+                checkpoints[self.clock] = self.snapshot()
+            self.tick()
+        self._first_queued = None
+        self.clock = self.sim_len
+        checkpoints[self.sim_len] = self.snapshot()
+
+        self._cache[key] = (tables, checkpoints, first_queued)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class Controller:
+    """
+    Queue-aware traffic light controller of every junction at once, serves
+    as an interface
+
+    Instead of a schedule per junction fixed in advance, a controller is
+    asked at every tick which road each junction gives green to, and can
+    look at the queues to decide (see Simulator.simulate_controlled).
+    Junctions are rows (one per scenario and junction in a
+    VectorizedSimulator), and roads their in_rds indices. The queues are
+    seen through Simulator.get_queued_in_rds, which lists only the roads
+    with cars queued, so that a tick costs as much as the traffic rather
+    than the size of the network, and no Python code runs per junction.
+
+    Attributes
+    ----------
+    min_green: fewest ticks a road stays green before the light can switch
+    """
+
+    def __init__(self, min_green=1):
+        self.min_green = min_green
+        self._in_degree = None
+        self._green = None
+        self._since = None
+
+    def reset(self, simulator):
+        """ Called by the simulator before its first tick """
+        self._in_degree = simulator.get_in_degrees()
+        self._green = np.zeros(len(self._in_degree), dtype=np.int64)
+        # The first roads given green can be switched right away
+        self._since = np.full(len(self._in_degree), -self.min_green, dtype=np.int64)
+
+    def get_green(self, simulator):
+        """ in_rds index given green at every junction (row), -1 for none """
+        raise NotImplementedError
+
+    def _get_green_values(self, rows, idx, values):
+        """ Value of the green road of every row, 0 for those not listed """
+        green_values = np.zeros(len(self._green), dtype=values.dtype)
+        is_green = idx == self._green[rows]
+        green_values[rows[is_green]] = values[is_green]
+        return green_values
+
+    @staticmethod
+    def _get_first(rows, keys):
+        """ Rows listed, and the position of their entry that sorts first by keys """
+        order = np.lexsort(keys + (rows,))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = rows[order[1:]] != rows[order[:-1]]
+        return rows[order[first]], order[first]
+
+    def _switch(self, clock, rows, idx):
+        """ Give green to road idx of each of the rows (if not already) """
+        changed = idx != self._green[rows]
+        self._green[rows[changed]] = idx[changed]
+        self._since[rows[changed]] = clock
+        return self._green
+
+
+class ScoreController(Controller):
+    """
+    Controller that gives each junction's green to its road with cars
+    queued that has the highest score (the lowest index on ties), once the
+    green road has been green for min_green ticks, if that score is higher
+    than the green road's (0 if it has no cars queued)
+    """
+
+    def get_scores(self, simulator, rows, idx, queue_len):
+        """ Score of each road listed by Simulator.get_queued_in_rds """
+        raise NotImplementedError
+
+    def get_green(self, simulator):
+        rows, idx, queue_len = simulator.get_queued_in_rds()
+        scores = self.get_scores(simulator, rows, idx, queue_len)
+        best_rows, best = self._get_first(rows, (idx, -scores))
+        switch = (simulator.clock - self._since[best_rows] >= self.min_green) \
+            & (scores[best] > self._get_green_values(rows, idx, scores)[best_rows])
+        return self._switch(simulator.clock, best_rows[switch], idx[best[switch]])
+
+
+class LongestQueueController(ScoreController):
+    """ Longest queue first: green for the road with the most cars queued """
+
+    def get_scores(self, simulator, rows, idx, queue_len):
+        return queue_len
+
+
+class MaxPressureController(ScoreController):
+    """
+    Max-pressure control: green for the road whose release relieves the
+    most congestion, i.e. with the most cars queued minus the cars queued on
+    the road that its first car would drive onto next (see
+    Simulator.get_downstream_lengths)
+    """
+
+    def get_scores(self, simulator, rows, idx, queue_len):
+        return queue_len - simulator.get_downstream_lengths()
+
+
+class GapOutController(Controller):
+    """
+    Actuated control: each junction gives green to its roads in turn, in the
+    order of in_rds, but keeps a road green (for at least min_green and at
+    most max_green ticks) only while cars are queued on it. Once its queue
+    is empty (a gap in the traffic), the light skips ahead to the next road
+    with cars queued, if any.
+
+    Attributes
+    ----------
+    min_green: same as parent class
+    max_green: most ticks a road stays green while other roads have cars
+               queued
+    """
+
+    def __init__(self, min_green=1, max_green=10):
+        super().__init__(min_green)
+        self.max_green = max_green
+
+    def get_green(self, simulator):
+        rows, idx, queue_len = simulator.get_queued_in_rds()
+        # Next road with cars queued after the green one, in cyclic order
+        # (the green one itself last)
+        offset = (idx - self._green[rows] - 1) % self._in_degree[rows]
+        next_rows, nxt = self._get_first(rows, (offset,))
+        elapsed = simulator.clock - self._since[next_rows]
+        switch = (elapsed >= self.min_green) \
+            & ((self._get_green_values(rows, idx, queue_len)[next_rows] == 0)
+               | (elapsed >= self.max_green))
+        return self._switch(simulator.clock, next_rows[switch], idx[nxt[switch]])
@@ -0,0 +1,151 @@
+import hashlib
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from simulation.arrays import NetworkArrays
+
+# Most cells of the destination x road cost matrices held at once while
+# computing next hops
+_CHUNK_SIZE = 1 << 22
+
+
+class ODDemand:
+    """
+    Origin-destination demand: each car starts on a random road, as with
+    NetworkArrays.generate_routes, but then drives to a destination junction
+    along a shortest route (by total road length) instead of walking at
+    random. Destinations are drawn among destination_num junctions picked at
+    random for the network, like the places people commute to.
+
+    Routes are followed through next-hop tables, computed for all the
+    destinations at once by a shortest path search on the reversed network
+    (see get_next_hops), so that creating cars costs a table lookup per road
+    driven, for all cars at once. The tables can be cached on disk, keyed by
+    the fingerprint of the network (see NetworkArrays.get_fingerprint) and
+    the destinations.
+
+    Attributes
+    ----------
+    destination_num: number of junctions that cars drive to (all of them
+                     if the network has fewer)
+    cache_dir: directory the next-hop tables are cached in, None not to
+               cache them
+    """
+
+    def __init__(self, destination_num=256, cache_dir=None):
+        self.destination_num = destination_num
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_next_hops(network_arrays: NetworkArrays, destinations):
+        """
+        Road to take out of every junction on a shortest route to each of
+        the destinations, as a len(destinations) x junction_num matrix: -1
+        at the destination itself and where it cannot be reached. Ties go
+        to the road listed first.
+        """
+        junction_num = network_arrays.junction_num
+        road_origin = network_arrays.road_origin
+        road_exit = network_arrays.road_exit
+        road_length = network_arrays.road_length
+        destinations = np.asarray(destinations, dtype=np.int64)
+
+        # Distance from every junction to each destination, through the
+        # shortest of any parallel roads (self-loops never shorten a route)
+        roads = np.flatnonzero(road_origin != road_exit)
+        roads = roads[np.lexsort((road_length[roads], road_exit[roads], road_origin[roads]))]
+        first = np.ones(len(roads), dtype=bool)
+        first[1:] = (road_origin[roads[1:]] != road_origin[roads[:-1]]) \
+            | (road_exit[roads[1:]] != road_exit[roads[:-1]])
+        roads = roads[first]
+        reversed_graph = csr_matrix((road_length[roads].astype(np.float64),
+                                     (road_exit[roads], road_origin[roads])),
+                                    shape=(junction_num, junction_num))
+        dist = dijkstra(reversed_graph, indices=destinations)
+
+        # The next hop is the road out of the junction that starts a
+        # shortest route, i.e. with the least length plus distance from its exit
+        out_offsets, out_roads = network_arrays.get_out_adjacency()
+        out_degree = np.diff(out_offsets)
+        has_out = np.flatnonzero(out_degree)
+        starts = out_offsets[has_out]
+        position = np.arange(len(out_roads))
+        next_hops = np.full((len(destinations), junction_num), -1,
+                            dtype=np.int32 if len(road_length) < 1 << 31 else np.int64)
+        chunk = max(1, _CHUNK_SIZE // max(len(out_roads), 1))
+        for i in range(0, len(destinations), chunk):
+            rows = slice(i, i + chunk)
+            cost = road_length[out_roads] + dist[rows, road_exit[out_roads]]
+            best = np.minimum.reduceat(cost, starts, axis=1)
+            is_best = cost == np.repeat(best, out_degree[has_out], axis=1)
+            hop = np.minimum.reduceat(np.where(is_best, position, len(position)), starts, axis=1)
+            next_hops[rows, has_out] = np.where(np.isfinite(best), out_roads[hop], -1)
+        next_hops[np.arange(len(destinations)), destinations] = -1
+        return next_hops
+
+    def load_next_hops(self, network_arrays: NetworkArrays, destinations):
+        """ get_next_hops, from the cache if it was computed before """
+        if self.cache_dir is None:
+            return ODDemand.get_next_hops(network_arrays, destinations)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        digest = hashlib.sha1(destinations.tobytes()).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, f'next_hops.'
+                                  f'{network_arrays.get_fingerprint()[:16]}.{digest}.npy')
+        if os.path.exists(cache_path):
+            return np.load(cache_path)
+
+        next_hops = ODDemand.get_next_hops(network_arrays, destinations)
+        # Write to a temporary file first, so that concurrent loaders never
+        # see a partially written cache
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, next_hops)
+        os.replace(tmp_path, cache_path)
+        return next_hops
+
+    def generate_routes(self, network_arrays: NetworkArrays, car_num, rng: np.random.Generator):
+        """
+        Shortest routes from a random road to a random destination, redrawn
+        until the destination can be reached from the end of the road (and
+        is not that junction). Returns the routes in CSR form, as
+        NetworkArrays.generate_routes does.
+        """
+        junction_num = network_arrays.junction_num
+        road_exit = network_arrays.road_exit
+        destinations = np.sort(rng.choice(junction_num, min(self.destination_num, junction_num),
+                                          replace=False))
+        next_hops = self.load_next_hops(network_arrays, destinations)
+        has_in = np.bincount(road_exit, minlength=junction_num) > 0
+        assert (next_hops[:, has_in] >= 0).any(), 'no destination can be reached'
+
+        first_road = np.empty(car_num, dtype=np.int64)
+        destination = np.empty(car_num, dtype=np.int64)
+        pending = np.arange(car_num)
+        while len(pending):
+            first_road[pending] = rng.integers(0, network_arrays.road_num, len(pending))
+            destination[pending] = rng.integers(0, len(destinations), len(pending))
+            pending = pending[next_hops[destination[pending], road_exit[first_road[pending]]] < 0]
+
+        # All cars take each step at once, and stop at their destination. A
+        # shortest route visits every junction at most once (unless there
+        # are roads of length 0 to go round in circles).
+        steps = [(np.arange(car_num), first_road)]
+        driving, road = steps[0]
+        for _ in range(junction_num):
+            road = next_hops[destination[driving], road_exit[road]].astype(np.int64)
+            arrived = road < 0
+            driving, road = driving[~arrived], road[~arrived]
+            if len(driving) == 0:
+                break
+            steps.append((driving, road))
+
+        route_offsets = np.zeros(car_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(np.concatenate([cars for cars, _ in steps]), minlength=car_num),
+                  out=route_offsets[1:])
+        route_roads = np.empty(route_offsets[-1], dtype=np.int64)
+        for i, (cars, roads) in enumerate(steps):
+            route_roads[route_offsets[cars] + i] = roads
+        return route_offsets, route_roads
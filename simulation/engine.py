@@ -0,0 +1,754 @@
+import hashlib
+import time
+from typing import List
+
+import numpy as np
+
+from simulation.arrays import NetworkArrays
+from simulation.car import Car
+from simulation.control import Controller
+from simulation.loader import TextInput
+from simulation.network import Network
+from simulation.schedule import PeriodicSchedule, PhaseSchedule
+from simulation.simulator import Simulator, SimulatorState
+
+
+class VectorizedSimulator(Simulator):
+    """
+    Simulator that keeps the state of every car and road in flat NumPy arrays
+    and advances all of them with one batched step per tick. With periodic
+    schedules, the ticks at which no junction dequeues and no car reaches the
+    end of its road are skipped over in one step. Given the same schedules it
+    produces exactly the same rewards as Simulator.
+
+    The network and cars are compiled into arrays the first time they are
+    needed; from then on the arrays own the state and the Car and Road
+    objects are left untouched. Several scenarios (copies of the whole state,
+    each with its own schedules) can be simulated at once: the state arrays
+    then hold scenario after scenario, and car c of scenario s is stored at
+    s * car_num + c (likewise for roads).
+
+    Compiled simulators can be pickled: only the arrays are kept, so the
+    copy is compact but can no longer be recompiled from the objects.
+
+    Attributes
+    ----------
+    junction_num: number of junctions
+    road_num: number of roads
+    car_num: number of cars
+    route_offsets: start of each car's route in route_roads (CSR offsets)
+    route_roads: road ids of all routes, concatenated
+    road_length: length of each road
+    in_rds: ids of the roads into each junction
+    in_degree: number of roads into each junction
+    in_rd_matrix: in_rds padded with -1 into a junction_num x max in_degree matrix
+    scenario_num: number of scenarios held in the state arrays
+    tick_size: number of ticks of the original simulation that each tick
+               stands for (see get_fidelity)
+    reward_scale: factor from the rewards of this simulator to estimates of
+                  those of the original one (see get_fidelity)
+    idx: index of each car's current road on its route
+    dist: how far on its current road each car has travelled
+    reward: reward collected by each car
+    top: car last enqueued on each road, -1 if the queue is empty
+    below: car enqueued on the same road before each queued car, -1 if none
+    head: car first enqueued on each road, -1 if the queue is empty
+    above: car enqueued on the same road after each queued car, -1 if none
+    queue_len: number of cars queued on each road
+    road_wait: waiting recorded on each road (see get_road_wait), None if
+               no run has been recorded
+    """
+
+    def __init__(self, network: Network = None, cars: List[Car] = None, sim_len=100,
+                 fifo=True):
+        super().__init__(network, cars, sim_len, fifo)
+        self.tick_size = 1
+        self.reward_scale = 1
+        self._source = None
+
+    @classmethod
+    def from_simulator(cls, simulator: Simulator):
+        """ Compile the current network, cars and state of an existing simulator """
+        vectorized = cls(simulator.network, simulator.cars, simulator.sim_len,
+                         simulator.fifo)
+        vectorized.compile()
+        vectorized.initial_state = simulator.initial_state
+        return vectorized
+
+    def compile(self):
+        """ Build the static arrays and load the current state of the objects """
+        roads = self.network.roads
+        junctions = self.network.junctions
+        road_ids = {road: i for i, road in enumerate(roads)}
+        self.junction_num = len(junctions)
+        self.road_num = len(roads)
+        self.car_num = len(self.cars)
+
+        self.road_length = np.array([road.length for road in roads], dtype=np.int64)
+        self._set_in_rds([np.array([road_ids[road] for road in junction.in_rds],
+                                   dtype=np.int64)
+                          for junction in junctions])
+
+        self.route_len = np.array([car.get_route_len() for car in self.cars], dtype=np.int64)
+        self.route_offsets = np.zeros(len(self.cars) + 1, dtype=np.int64)
+        np.cumsum(self.route_len, out=self.route_offsets[1:])
+        self.route_roads = np.array([road_ids[road] for car in self.cars
+                                     for road in car.route], dtype=np.int64)
+
+        # Queues are doubly linked lists threaded through the car array, so
+        # that both ends can be dequeued in O(1)
+        state = Simulator.snapshot(self)
+        self.idx, self.dist, self.reward = state.idx, state.dist, state.reward
+        self.top, self.below = state.top, state.below
+
+        self._set_scenario_num(1)
+        self._link_queues()
+        self._source = (self.network, self.cars)
+
+    def load_text(self, filepath, use_cache=True):
+        """
+        Compile a Hash Code input file straight into arrays, without building
+        the Junction, Road and Car objects (network and cars stay None). The
+        state is the same as after Simulator.initialize_from_text.
+        """
+        start = time.perf_counter()
+        text_input = TextInput.load(filepath, use_cache=use_cache)
+        self.sim_len = text_input.duration
+        parsed = time.perf_counter()
+        self._load(text_input.junction_num, text_input.road_exit, text_input.road_length,
+                   text_input.route_offsets, text_input.route_roads)
+
+        # Each car starts queued at the end of its first street
+        first_roads = self.route_roads[self.route_offsets[:-1]]
+        self.dist = self.road_length[first_roads]
+        self._enqueue(np.arange(self.car_num, dtype=np.int64), first_roads)
+        self.initial_state = self.snapshot()
+        if self.profiler is not None:
+            self.profiler.add_time('parse', parsed - start)
+            self.profiler.add_time('build', time.perf_counter() - parsed)
+
+    def load_arrays(self, network_arrays: NetworkArrays, route_offsets=None, route_roads=None):
+        """
+        Compile a network given as edge arrays, and the routes of the cars in
+        CSR form (none by default), without building any objects. Every car
+        starts at the beginning of its first road.
+        """
+        if route_offsets is None:
+            route_offsets = np.zeros(1, dtype=np.int64)
+            route_roads = np.zeros(0, dtype=np.int64)
+        self._load(network_arrays.junction_num, network_arrays.road_exit,
+                   network_arrays.road_length, route_offsets, route_roads)
+        self.initial_state = self.snapshot()
+
+    def _initialize_random_cars(self, network_arrays, car_num, rng, demand=None):
+        """ Load the network and routes straight into arrays (network and cars stay None) """
+        self.load_arrays(network_arrays,
+                         *Simulator._generate_routes(network_arrays, car_num, rng, demand))
+        # As after Car.gen_route, every car is at the end of its first road
+        # (without being queued) until reset
+        self.dist = self.road_length[self.route_roads[self.route_offsets[:-1]]]
+
+    def _initialize_objects(self, network, car_num):
+        super()._initialize_objects(network, car_num)
+        self.compile()
+
+    def _load(self, junction_num, road_exit, road_length, route_offsets, route_roads):
+        """ Set the static arrays, with every car at the start of its route """
+        self.network = None
+        self.cars = None
+        self.junction_num = junction_num
+        self.road_num = len(road_length)
+        self.car_num = len(route_offsets) - 1
+
+        self.road_length = road_length
+        # in_rds of each junction are in the order the roads are listed
+        order = np.argsort(road_exit, kind='stable')
+        bounds = np.searchsorted(road_exit[order], np.arange(1, self.junction_num))
+        self._set_in_rds(np.split(order, bounds))
+
+        self.route_offsets = route_offsets
+        self.route_roads = route_roads
+        self.route_len = np.diff(self.route_offsets)
+
+        self.idx = np.zeros(self.car_num, dtype=np.int64)
+        self.dist = np.zeros(self.car_num, dtype=np.int64)
+        self.reward = np.zeros(self.car_num, dtype=np.int64)
+        self.top = np.full(self.road_num, -1, dtype=np.int64)
+        self.below = np.full(self.car_num, -1, dtype=np.int64)
+        self.head = np.full(self.road_num, -1, dtype=np.int64)
+        self.above = np.full(self.car_num, -1, dtype=np.int64)
+        self.queue_len = np.zeros(self.road_num, dtype=np.int64)
+        self.road_wait = None
+        self._set_scenario_num(1)
+        self._source = (None, None)
+
+    def _link_queues(self):
+        """ Derive head and above from top and below """
+        self.above = np.full(len(self.below), -1, dtype=np.int64)
+        linked = np.flatnonzero(self.below >= 0)
+        self.above[self.below[linked]] = linked
+        self.head = np.full(len(self.top), -1, dtype=np.int64)
+        queued = np.zeros(len(self.below), dtype=bool)
+        queued[self.top[self.top >= 0]] = True
+        queued[self.below[linked]] = True
+        # A queued car waits at the end of its current road
+        queued = np.flatnonzero(queued)
+        road = self.route_roads[self.route_offsets[self._car[queued]] + self.idx[queued]] \
+            + self._road_shift[queued]
+        bottom = self.below[queued] < 0
+        self.head[road[bottom]] = queued[bottom]
+        self.queue_len = np.bincount(road, minlength=len(self.top))
+        self.road_wait = None
+
+    def _set_in_rds(self, in_rds):
+        self.in_rds = in_rds
+        self.in_degree = np.array([len(rds) for rds in in_rds], dtype=np.int64)
+        self.in_rd_matrix = np.full((len(in_rds), max(self.in_degree, default=0)), -1,
+                                    dtype=np.int64)
+        self._road_junction = np.zeros(self.road_num, dtype=np.int64)
+        self._road_slot = np.zeros(self.road_num, dtype=np.int64)
+        for i, rds in enumerate(in_rds):
+            self.in_rd_matrix[i, :len(rds)] = rds
+            self._road_junction[rds] = i
+            self._road_slot[rds] = np.arange(len(rds))
+
+    def _ensure_compiled(self):
+        if self._source is None or self._source[0] is not self.network \
+                or self._source[1] is not self.cars:
+            self.compile()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['network'] = None
+        state['cars'] = None
+        state['_source'] = (None, None)
+        for key in ['_schedules', '_periodic', '_cycle_len', '_table_offset',
+                    '_table_pool', '_scheduled', '_scheduled_junction',
+                    '_scheduled_shift', '_phase_row', '_phase_start', '_phase_len']:
+            state.pop(key, None)
+        return state
+
+    def get_fingerprint(self):
+        """
+        Hash of everything the rewards of simulate_batch depend on: the
+        network, the routes, the current state, sim_len and fifo
+        """
+        self._ensure_compiled()
+        digest = hashlib.sha1(np.array([self.sim_len, self.fifo, self.clock, self.junction_num,
+                                        self.scenario_num, self.tick_size]).tobytes())
+        for array in [self.road_length, self.in_rd_matrix, self.route_offsets,
+                      self.route_roads, self.idx, self.dist, self.reward, self.top,
+                      self.below]:
+            digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def get_fidelity(self, horizon=1.0, car_fraction=1.0, tick_size=1, seed=0):
+        """
+        Cheaper approximation of this simulator, starting from its current
+        state, with only the first horizon fraction of sim_len simulated, a
+        fixed random subset of car_fraction of the cars (the subsets drawn
+        with the same seed are nested), and ticks that each stand for
+        tick_size ticks (road lengths and schedule durations are divided by
+        tick_size, rounding up). reward_scale accounts for the missing cars
+        and the longer ticks, but not for the shorter horizon.
+        """
+        self._ensure_compiled()
+        assert self.scenario_num == 1
+        keep_num = max(1, int(round(self.car_num * car_fraction)))
+        keep = np.sort(np.random.default_rng(seed).permutation(self.car_num)[:keep_num])
+        return self._get_car_subset(keep, -(-int(round(self.sim_len * horizon)) // tick_size),
+                                    tick_size, self.car_num / keep_num)
+
+    def get_local(self, junctions):
+        """
+        Approximation of this simulator, starting from its current state,
+        restricted to the cars whose remaining route goes through any of the
+        junctions. Only these cars can be affected first-hand by changing the
+        schedules of the junctions.
+        """
+        self._ensure_compiled()
+        assert self.scenario_num == 1
+        through = np.isin(self._road_junction[self.route_roads], junctions)
+        car = np.repeat(np.arange(self.car_num), self.route_len)
+        ahead = np.arange(len(self.route_roads)) >= self.route_offsets[car] + self.idx[car]
+        keep = np.unique(car[through & ahead])
+        return self._get_car_subset(keep, self.sim_len, 1, 1)
+
+    def _get_car_subset(self, keep, sim_len, tick_size, reward_scale):
+        """ Simulator with only the cars keep, in their current state """
+        keep_num = len(keep)
+        route_len = self.route_len[keep]
+        route_offsets = np.zeros(keep_num + 1, dtype=np.int64)
+        np.cumsum(route_len, out=route_offsets[1:])
+        route_roads = self.route_roads[np.repeat(self.route_offsets[keep] - route_offsets[:-1],
+                                                 route_len) + np.arange(route_offsets[-1])]
+        road_length = -(-self.road_length // tick_size)
+
+        subset = VectorizedSimulator(sim_len=sim_len, fifo=self.fifo)
+        subset._load(self.junction_num, self._road_junction, road_length, route_offsets,
+                     route_roads)
+        subset.tick_size = self.tick_size * tick_size
+        subset.reward_scale = self.reward_scale * tick_size * reward_scale
+        subset.clock = self.clock // tick_size
+        subset.idx = self.idx[keep]
+        subset.reward = self.reward[keep].copy()
+        # Queued cars stay queued, and cars in transit do not reach the end
+        road = self.route_roads[np.minimum(self.route_offsets[keep] + self.idx[keep],
+                                           len(self.route_roads) - 1)]
+        subset.dist = np.where(self.dist[keep] >= self.road_length[road], road_length[road],
+                               self.dist[keep] // tick_size)
+
+        # Enqueue the kept cars in the order they are queued in
+        new_id = np.full(self.car_num, -1, dtype=np.int64)
+        new_id[keep] = np.arange(keep_num)
+        new_id = new_id.tolist()
+        cars, roads = [], []
+        above = self.above.tolist()
+        for road, car in zip(np.flatnonzero(self.head >= 0).tolist(),
+                             self.head[self.head >= 0].tolist()):
+            while car >= 0:
+                if new_id[car] >= 0:
+                    cars.append(new_id[car])
+                    roads.append(road)
+                car = above[car]
+        subset._enqueue(np.array(cars, dtype=np.int64), np.array(roads, dtype=np.int64))
+        subset.initial_state = subset.snapshot()
+        return subset
+
+    def _set_scenario_num(self, scenario_num):
+        """ Precompute the scenario of every car in the state arrays """
+        self.scenario_num = scenario_num
+        self._car = np.tile(np.arange(self.car_num, dtype=np.int64), scenario_num)
+        self._road_shift = np.repeat(np.arange(scenario_num, dtype=np.int64)
+                                     * self.road_num, self.car_num)
+
+    def snapshot(self) -> SimulatorState:
+        self._ensure_compiled()
+        return SimulatorState(self.clock, self.idx.copy(), self.dist.copy(),
+                              self.reward.copy(), self.top.copy(), self.below.copy())
+
+    def restore(self, state: SimulatorState):
+        """ Copy a snapshot back into the state arrays, which are reused if possible """
+        self._ensure_compiled()
+        if len(state.idx) == len(self.idx):
+            for name in ['idx', 'dist', 'reward', 'top', 'below']:
+                np.copyto(getattr(self, name), getattr(state, name))
+        else:
+            for name in ['idx', 'dist', 'reward', 'top', 'below']:
+                setattr(self, name, getattr(state, name).copy())
+            self._set_scenario_num(len(state.idx) // self.car_num)
+        self._link_queues()
+        self.clock = state.clock
+
+    def _tile_state(self, scenario_num):
+        """ Copy the state of the (single) current scenario into scenario_num ones """
+        assert self.scenario_num == 1
+        car_num = self.car_num
+        car_shift = np.repeat(np.arange(scenario_num, dtype=np.int64) * car_num,
+                              self.road_num)
+        top = np.tile(self.top, scenario_num)
+        self.top = np.where(top >= 0, top + car_shift, -1)
+        car_shift = np.repeat(np.arange(scenario_num, dtype=np.int64) * car_num, car_num)
+        below = np.tile(self.below, scenario_num)
+        self.below = np.where(below >= 0, below + car_shift, -1)
+        self.idx = np.tile(self.idx, scenario_num)
+        self.dist = np.tile(self.dist, scenario_num)
+        self.reward = np.tile(self.reward, scenario_num)
+        self._set_scenario_num(scenario_num)
+        self._link_queues()
+
+    def _set_schedules(self, scenario_schedules):
+        """ Precompute what is needed to find the green road of each junction """
+        junction_num = self.junction_num
+        self._schedules = [[schedules[i] for i in range(junction_num)]
+                           for schedules in scenario_schedules]
+        if self.tick_size > 1:
+            self._schedules = self._get_coarse_schedules(self._schedules)
+        self._periodic = all(isinstance(schedule, PeriodicSchedule)
+                             for schedules in self._schedules for schedule in schedules)
+        if not self._periodic:
+            return
+
+        # Periodic schedules are compiled into tables of in_rds indices per
+        # t mod cycle_len. Identical schedules share one table in a pool, and
+        # one row of the phase arrays: the start and length within the cycle
+        # of the phase of each index (-1 in column 0, then 0, 1, ...).
+        size = len(self._schedules) * junction_num
+        self._cycle_len = np.zeros(size, dtype=np.int64)
+        self._table_offset = np.zeros(size, dtype=np.int64)
+        self._phase_row = np.zeros(size, dtype=np.int64)
+        tables = {}
+        phases = []
+        pool_len = 0
+        for s, schedules in enumerate(self._schedules):
+            for i, schedule in enumerate(schedules):
+                # Junctions without roads in, or without phases, are never green
+                if len(self.in_rds[i]) == 0 or len(schedule.table) == 0:
+                    continue
+                key = schedule.get_key()
+                if key not in tables:
+                    tables[key] = (pool_len, schedule.table, len(phases))
+                    pool_len += len(schedule.table)
+                    phases.append(schedule.get_phases())
+                j = s * junction_num + i
+                self._table_offset[j], table, self._phase_row[j] = tables[key]
+                self._cycle_len[j] = len(table)
+        self._table_pool = np.concatenate([table for _, table, _ in tables.values()]
+                                          or [np.zeros(0, dtype=np.int64)])
+        shape = (max(len(phases), 1), max((len(length) for _, length in phases), default=1))
+        self._phase_start = np.zeros(shape, dtype=np.int64)
+        self._phase_len = np.zeros(shape, dtype=np.int64)
+        for row, (phase_start, phase_len) in enumerate(phases):
+            self._phase_start[row, :len(phase_start)] = phase_start
+            self._phase_len[row, :len(phase_len)] = phase_len
+        self._scheduled = np.flatnonzero(self._cycle_len > 0)
+        self._scheduled_junction = self._scheduled % junction_num
+        self._scheduled_shift = self._scheduled // junction_num * self.road_num
+        # Last index given green by each row, which every junction must have
+        last_idx = np.where(self._phase_len > 0, np.arange(shape[1]) - 1, -1).max(axis=1)
+        assert (last_idx[self._phase_row[self._scheduled]]
+                < self.in_degree[self._scheduled_junction]).all(), \
+            'A schedule gives green to more roads than its junction has'
+
+    def _get_coarse_schedules(self, scenario_schedules):
+        """ Periodic schedules with their durations divided by tick_size, rounding up """
+        coarse = {}
+        for schedules in scenario_schedules:
+            for i, schedule in enumerate(schedules):
+                if isinstance(schedule, PeriodicSchedule):
+                    key = schedule.get_key()
+                    if key not in coarse:
+                        coarse[key] = schedule.get_coarse(self.tick_size)
+                    schedules[i] = coarse[key]
+        return scenario_schedules
+
+    def _green_roads(self, t):
+        """ Road given green at each scheduled junction at time t """
+        if not self._periodic:
+            return np.array([self.in_rds[i][idx] + s * self.road_num
+                             for s, schedules in enumerate(self._schedules)
+                             for i, schedule in enumerate(schedules)
+                             if len(self.in_rds[i])
+                             for idx in [schedule.get_incoming_at(t)] if idx is not None],
+                            dtype=np.int64)
+
+        scheduled = self._scheduled
+        junctions = self._scheduled_junction
+        idx = self._table_pool[self._table_offset[scheduled]
+                               + t % self._cycle_len[scheduled]]
+        idx = np.where(idx < 0, idx + self.in_degree[junctions], idx)
+        return self.in_rd_matrix[junctions, idx] + self._scheduled_shift
+
+    def tick(self):
+        if self.profiler is not None:
+            self._step_profiled(bulk=False)
+            return
+        # Junctions: dequeue a car from the queue of every green road. Each
+        # road ends at a single junction, so the roads are all distinct.
+        self._release(self._dequeue(self._green_roads(self.clock)))
+        self._advance(1)
+
+    def _step_profiled(self, bulk):
+        """
+        One tick, or one step of _run (several ticks if none dequeues) if bulk,
+        timing the schedule lookups, dequeues, skips and advances apart
+        """
+        profiler = self.profiler
+        start = time.perf_counter()
+        roads = self._green_roads(self.clock)
+        looked_up = time.perf_counter()
+        cars = self._dequeue(roads)
+        dequeued = time.perf_counter()
+        if len(cars) or not bulk or not self._periodic:
+            self._release(cars)
+            skipped = dequeued
+            ticks = self._advance(1)
+        else:
+            quiet_len = self._get_quiet_len()
+            skipped = time.perf_counter()
+            ticks = self._advance(quiet_len)
+
+        profiler.add_time('schedule', looked_up - start)
+        profiler.add_time('dequeue', dequeued - looked_up)
+        profiler.add_time('skip', skipped - dequeued)
+        profiler.add_time('advance', time.perf_counter() - skipped)
+        profiler.count('steps')
+        profiler.count('ticks', ticks)
+        profiler.count('dequeues', len(cars))
+        # The green roads stay empty over the ticks skipped
+        profiler.count('idle_junctions', len(roads) * ticks - len(cars))
+
+    def _release(self, cars):
+        """ Move dequeued cars onto the next road of their route """
+        self.idx[cars] += 1
+        self.dist[cars[self.idx[cars] < self.route_len[self._car[cars]]]] = 0
+
+    def _advance(self, ticks):
+        """
+        Advance every car still on its route by up to ticks units at once,
+        stopping after the first tick at which any of them reaches the end of
+        its road (the cars that do are enqueued), and return the number of
+        ticks advanced. No junction may dequeue in the meantime.
+        """
+        active = np.flatnonzero(self.idx < self.route_len[self._car])
+        road = self.route_roads[self.route_offsets[self._car[active]] + self.idx[active]]
+        remaining = self.road_length[road] - self.dist[active]
+        moving = remaining > 0
+        active = active[moving]
+        road = road[moving] + self._road_shift[active]
+        remaining = remaining[moving]
+        if len(remaining):
+            ticks = min(ticks, int(remaining.min()))
+        self.dist[active] += ticks
+        self.reward[active] += ticks
+
+        # Enqueue the cars that reached the end of their road, in car order
+        self.clock += ticks - 1
+        arrived = remaining == ticks
+        self._enqueue(active[arrived], road[arrived])
+        self.clock += 1
+        return ticks
+
+    def _get_quiet_len(self):
+        """
+        Number of ticks from now (at least 1, at most until the end of the
+        simulation) before the next tick at which a road with cars queued is
+        green, given that none is green now. Needs periodic schedules.
+        """
+        quiet_len = self.sim_len - self.clock
+        if self.metrics is not None:
+            quiet_len = self.metrics.get_next_sample(self.clock) - self.clock
+        queued = np.flatnonzero(self.top >= 0)
+        road = queued % self.road_num
+        j = queued // self.road_num * self.junction_num + self._road_junction[road]
+        # Roads into junctions without phases are never green
+        scheduled = self._cycle_len[j] > 0
+        road, j = road[scheduled], j[scheduled]
+        if len(road) == 0:
+            return quiet_len
+        junction = self._road_junction[road]
+        x = self.clock % self._cycle_len[j]
+        row = self._phase_row[j]
+        slot = self._road_slot[road]
+        # A road is green in the phase of its slot (column slot + 1 of the
+        # phase arrays), and the last road also in phase -1 (column 0)
+        phase_num = self._phase_len.shape[1]
+        wait = np.full(len(road), quiet_len, dtype=np.int64)
+        for column, valid in [(np.minimum(slot + 1, phase_num - 1), slot + 1 < phase_num),
+                              (np.zeros_like(slot), slot == self.in_degree[junction] - 1)]:
+            start = self._phase_start[row, column]
+            length = self._phase_len[row, column]
+            valid &= length > 0
+            wait = np.where(valid, np.minimum(wait, (start - x) % self._cycle_len[j]), wait)
+        return max(1, int(wait.min()))
+
+    def _dequeue(self, roads):
+        """ Release a car from each of the (distinct) roads that have any """
+        if self.fifo:
+            first, after, last, before = self.head, self.above, self.top, self.below
+        else:
+            first, after, last, before = self.top, self.below, self.head, self.above
+        cars = first[roads]
+        has_car = cars >= 0
+        roads = roads[has_car]
+        cars = cars[has_car]
+        self.queue_len[roads] -= 1
+        if self.road_wait is not None:
+            self.road_wait[roads] += self.clock
+        nxt = after[cars]
+        first[roads] = nxt
+        emptied = nxt < 0
+        last[roads[emptied]] = -1
+        before[nxt[~emptied]] = -1
+        after[cars] = -1
+        return cars
+
+    def _enqueue(self, cars, roads):
+        """ Append cars (in ascending order) to the queues of roads """
+        if len(cars) == 0:
+            return
+        if self.profiler is not None:
+            self.profiler.count('enqueues', len(cars))
+        order = np.argsort(roads, kind='stable')
+        cars = cars[order]
+        roads = roads[order]
+        first = np.ones(len(roads), dtype=bool)
+        first[1:] = roads[1:] != roads[:-1]
+        last = np.ones(len(roads), dtype=bool)
+        last[:-1] = first[1:]
+        self.below[cars] = np.where(first, self.top[roads], np.roll(cars, 1))
+        self.above[cars] = np.where(last, -1, np.roll(cars, -1))
+        group_roads = roads[first]
+        group_first = cars[first]
+        group_size = np.diff(np.append(np.flatnonzero(first), len(roads)))
+        self.queue_len[group_roads] += group_size
+        if self.road_wait is not None:
+            self.road_wait[group_roads] -= group_size * self.clock
+        old_top = self.top[group_roads]
+        appended = old_top >= 0
+        self.above[old_top[appended]] = group_first[appended]
+        self.head[group_roads[~appended]] = group_first[~appended]
+        self.top[roads[last]] = cars[last]
+
+    def _run(self, scenario_schedules):
+        self._set_schedules(scenario_schedules)
+        # A car queued from tick t to t' adds t' - t to the wait of its road
+        self.road_wait = np.zeros(len(self.top), dtype=np.int64)
+        # Between two ticks at which a junction dequeues or a car reaches the
+        # end of its road, every car in transit just moves on, so such ticks
+        # are advanced in bulk
+        self.clock = 0
+        if self.metrics is not None:
+            self.metrics.start(self)
+        while self.clock < self.sim_len:
+            if self.profiler is not None:
+                self._step_profiled(bulk=True)
+            else:
+                cars = self._dequeue(self._green_roads(self.clock))
+                if len(cars) or not self._periodic:
+                    self._release(cars)
+                    self._advance(1)
+                else:
+                    self._advance(self._get_quiet_len())
+            if self.metrics is not None:
+                self.metrics.observe(self)
+
+    def simulate(self, schedules):
+        self._ensure_compiled()
+        assert self.scenario_num == 1
+        if self.network is not None:
+            for i in range(self.junction_num):
+                self.network.junctions[i].schedule = schedules[i]
+        self._run([schedules])
+
+    def simulate_controlled(self, controller: Controller):
+        self._ensure_compiled()
+        assert self.scenario_num == 1
+        self._run_controlled(controller)
+
+    def _run_controlled(self, controller):
+        """ Same as _run, with the green roads decided at every tick by controller """
+        self.road_wait = np.zeros(len(self.top), dtype=np.int64)
+        self.clock = 0
+        controller.reset(self)
+        if self.metrics is not None:
+            self.metrics.start(self)
+        while self.clock < self.sim_len:
+            start = time.perf_counter()
+            green = controller.get_green(self)
+            if self.profiler is not None:
+                self.profiler.add_time('control', time.perf_counter() - start)
+            # Only the roads with cars queued need to be looked at
+            roads, rows, idx = self._get_queued_in_rds()
+            self._release(self._dequeue(roads[idx == green[rows]]))
+            self._advance(1)
+            if self.metrics is not None:
+                self.metrics.observe(self)
+
+    def simulate_batch(self, schedule_matrix, schedule_type='uniform', mode_num=2):
+        self._ensure_compiled()
+        schedule_matrix = np.atleast_2d(schedule_matrix)
+        state = self.snapshot()
+        self._tile_state(len(schedule_matrix))
+        self._run([self.get_schedules(x, schedule_type, mode_num)
+                   for x in schedule_matrix])
+        rewards = self.get_rewards()
+        self.restore(state)
+        return rewards
+
+    def get_uniform_schedules(self, red_len, green_len):
+        return [PeriodicSchedule([red_len, green_len]) for _ in range(self.junction_num)]
+
+    def get_distinct_schedules(self, red_lens, green_lens):
+        return [PeriodicSchedule([red_lens[i], green_lens[i]])
+                for i in range(self.junction_num)]
+
+    def get_round_robin_schedules(self, durations):
+        self._ensure_compiled()
+        offsets = np.concatenate([[0], np.cumsum(self.in_degree)]).tolist()
+        assert len(durations) == offsets[-1]
+        return [PhaseSchedule.get_round_robin(durations[offsets[i]:offsets[i + 1]])
+                for i in range(self.junction_num)]
+
+    def get_road_wait(self):
+        """
+        Waiting recorded on each road during the last run (of simulate or
+        simulate_batch, until the state is restored): the sum over ticks of
+        its queue length, as a scenario_num x road_num matrix
+        """
+        assert self.road_wait is not None, 'no run has been recorded since the state was set'
+        return (self.road_wait + self.clock * self.queue_len).reshape(self.scenario_num, -1)
+
+    def get_junction_wait(self):
+        """ Waiting recorded on the roads into each junction, as in get_road_wait """
+        road_wait = self.get_road_wait()
+        junction_wait = np.zeros((self.scenario_num, self.junction_num), dtype=np.int64)
+        np.add.at(junction_wait, (slice(None), self._road_junction), road_wait)
+        return junction_wait
+
+    def get_in_degrees(self):
+        """ Same as parent class, for every scenario and junction """
+        self._ensure_compiled()
+        return np.tile(self.in_degree, self.scenario_num)
+
+    def get_queued_in_rds(self):
+        """ Same as parent class, with the junctions of scenario s shifted by s * junction_num """
+        self._ensure_compiled()
+        roads, rows, idx = self._get_queued_in_rds()
+        return rows, idx, self.queue_len[roads]
+
+    def _get_queued_in_rds(self):
+        """ Roads with cars queued, the junction (row) each ends at and its in_rds index there """
+        roads = np.flatnonzero(self.top >= 0)
+        road = roads % self.road_num
+        rows = roads // self.road_num * self.junction_num + self._road_junction[road]
+        return roads, rows, self._road_slot[road]
+
+    def get_downstream_lengths(self):
+        self._ensure_compiled()
+        roads = np.flatnonzero(self.top >= 0)
+        cars = (self.head if self.fifo else self.top)[roads]
+        downstream = np.zeros(len(cars), dtype=np.int64)
+        route_idx = self.idx[cars] + 1
+        has_next = route_idx < self.route_len[self._car[cars]]
+        cars = cars[has_next]
+        next_road = self.route_roads[self.route_offsets[self._car[cars]] + route_idx[has_next]] \
+            + self._road_shift[cars]
+        downstream[has_next] = self.queue_len[next_road]
+        return downstream
+
+    def get_route_idx(self):
+        self._ensure_compiled()
+        return self.idx[:self.car_num]
+
+    def get_queue_lengths(self):
+        self._ensure_compiled()
+        return self.queue_len[:self.road_num]
+
+    def get_rewards(self):
+        """ Reward of each scenario """
+        self._ensure_compiled()
+        return self.reward.reshape(self.scenario_num, -1).sum(axis=1)
+
+    def get_reward(self):
+        self._ensure_compiled()
+        return int(self.reward.sum())
+
+    def reset(self):
+        self._ensure_compiled()
+        start = time.perf_counter()
+        if self.initial_state is not None:
+            self.restore(self.initial_state)
+        else:
+            self.idx[:] = 0
+            self.dist[:] = 0
+            self.reward[:] = 0
+            self.top[:] = -1
+            self.below[:] = -1
+            self.head[:] = -1
+            self.above[:] = -1
+            self.queue_len[:] = 0
+            self.road_wait = None
+            self.clock = 0
+        if self.profiler is not None:
+            self.profiler.add_time('reset', time.perf_counter() - start)
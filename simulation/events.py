@@ -0,0 +1,164 @@
+import heapq
+from bisect import bisect_left
+
+import numpy as np
+
+from simulation.engine import VectorizedSimulator
+
+# Within a tick, junctions dequeue before cars move (see Simulator.tick)
+_DEQUEUE = 0
+_ARRIVE = 1
+
+
+class EventDrivenSimulator(VectorizedSimulator):
+    """
+    Simulator that jumps the clock straight between events instead of
+    touching every car and junction on every tick. Given the same periodic
+    schedules it produces exactly the same rewards (and final state) as
+    Simulator, at a cost proportional to the number of events.
+
+    There are two kinds of events, kept in a priority queue ordered by
+    (time, kind, id) so that they happen in the same order as in a tick:
+    a car reaching the end of its road (and joining the road's queue), and
+    the queue of a road being dequeued when its light is green. A car in
+    transit is not touched until it arrives; its reward for the whole road
+    is accounted for when it starts the road.
+
+    Only PeriodicSchedule is supported, since the next time a road turns
+    green has to be known in advance.
+    """
+
+    def _run(self, scenario_schedules):
+        self._set_schedules(scenario_schedules)
+        if not self._periodic:
+            raise TypeError('Event-driven simulation needs a PeriodicSchedule at every junction')
+        if self.metrics is not None:
+            raise TypeError('Event-driven simulation does not go through every tick, '
+                            'so it cannot record metrics')
+
+        self._route_lists = (self.route_offsets.tolist(), self.route_len.tolist(),
+                             self.route_roads.tolist(), self.road_length.tolist())
+
+        for s in range(self.scenario_num):
+            self._run_scenario(s)
+        self.clock = self.sim_len
+        self._link_queues()
+
+    def _get_green_ticks(self, s, road):
+        """ Cycle length and sorted ticks within the cycle where road is green """
+        j = s * self.junction_num + self._road_junction[road]
+        cycle_len = int(self._cycle_len[j])
+        if cycle_len == 0:
+            return 1, []
+        table = self._table_pool[self._table_offset[j]:self._table_offset[j] + cycle_len]
+        table = np.where(table < 0, table + self.in_degree[self._road_junction[road]], table)
+        return cycle_len, np.flatnonzero(table == self._road_slot[road]).tolist()
+
+    def _run_scenario(self, s):
+        sim_len = self.sim_len
+        route_offsets, route_len, route_roads, road_length = self._route_lists
+        car0, car1 = s * self.car_num, (s + 1) * self.car_num
+        road0, road1 = s * self.road_num, (s + 1) * self.road_num
+
+        idx = self.idx[car0:car1].tolist()
+        dist = self.dist[car0:car1].tolist()
+        reward = self.reward[car0:car1].tolist()
+        top, head = [np.where(queue[road0:road1] >= 0, queue[road0:road1] - car0, -1).tolist()
+                     for queue in (self.top, self.head)]
+        below, above = [np.where(link[car0:car1] >= 0, link[car0:car1] - car0, -1).tolist()
+                        for link in (self.below, self.above)]
+        if self.fifo:
+            first, after, last, before = head, above, top, below
+        else:
+            first, after, last, before = top, below, head, above
+        # Tick at which each car started its current road, -1 if not in transit
+        start = [-1] * self.car_num
+        dequeue_scheduled = [False] * self.road_num
+        green_ticks = {}
+        events = []
+
+        def next_green(road, t):
+            """ First tick from t on at which road is green, sim_len if never """
+            if road not in green_ticks:
+                green_ticks[road] = self._get_green_ticks(s, road)
+            cycle_len, ticks = green_ticks[road]
+            if not ticks:
+                return sim_len
+            x = t % cycle_len
+            i = bisect_left(ticks, x)
+            if i < len(ticks):
+                return t + ticks[i] - x
+            return t + cycle_len - x + ticks[0]
+
+        def schedule_dequeue(road, t):
+            t = next_green(road, t)
+            if t < sim_len:
+                heapq.heappush(events, (t, _DEQUEUE, road))
+                dequeue_scheduled[road] = True
+            else:
+                dequeue_scheduled[road] = False
+
+        def drive(car, t):
+            """ Move car from t on until the end of its road """
+            remaining = road_length[route_roads[route_offsets[car] + idx[car]]] - dist[car]
+            if remaining <= 0:
+                return
+            reward[car] += min(remaining, sim_len - t)
+            start[car] = t
+            if t + remaining - 1 < sim_len:
+                heapq.heappush(events, (t + remaining - 1, _ARRIVE, car))
+
+        for car in range(self.car_num):
+            if idx[car] < route_len[car]:
+                drive(car, 0)
+        for road in range(self.road_num):
+            if top[road] >= 0:
+                schedule_dequeue(road, 0)
+
+        while events:
+            t, kind, i = heapq.heappop(events)
+            if kind == _DEQUEUE:
+                road = i
+                car = first[road]
+                first[road] = after[car]
+                if after[car] >= 0:
+                    before[after[car]] = -1
+                else:
+                    last[road] = -1
+                after[car] = -1
+                idx[car] += 1
+                if idx[car] < route_len[car]:
+                    dist[car] = 0
+                    drive(car, t)
+                if first[road] >= 0:
+                    schedule_dequeue(road, t + 1)
+                else:
+                    dequeue_scheduled[road] = False
+            else:
+                car = i
+                road = route_roads[route_offsets[car] + idx[car]]
+                dist[car] = road_length[road]
+                start[car] = -1
+                below[car] = top[road]
+                if top[road] >= 0:
+                    above[top[road]] = car
+                else:
+                    head[road] = car
+                top[road] = car
+                if not dequeue_scheduled[road]:
+                    schedule_dequeue(road, t + 1)
+
+        # Cars still in transit have moved on every tick since they started
+        for car in range(self.car_num):
+            if start[car] >= 0:
+                dist[car] += sim_len - start[car]
+
+        self.idx[car0:car1] = idx
+        self.dist[car0:car1] = dist
+        self.reward[car0:car1] = reward
+        for queue, values in ((self.top, top), (self.head, head)):
+            values = np.array(values, dtype=np.int64)
+            queue[road0:road1] = np.where(values >= 0, values + car0, -1)
+        for link, values in ((self.below, below), (self.above, above)):
+            values = np.array(values, dtype=np.int64)
+            link[car0:car1] = np.where(values >= 0, values + car0, -1)
@@ -2,6 +2,11 @@ from typing import List
 
 from simulation.schedule import Schedule, PeriodicSchedule
 from simulation.road import Road
+from simulation.util import swap_remove
+
+
+# Schedules hold no state, so junctions without one all share the default
+_DEFAULT_SCHEDULE = Schedule()
 
 
 class Junction:
@@ -14,8 +19,17 @@ class Junction:
     in_rds: roads into the junction (since this is a directed graph)
     out_rds: roads out of the junction
     schedule: traffic light sequence at this junction
+
+    in_rds and out_rds are indexed by the origin and exit of their roads, so
+    they should only be modified through Road.connect and Road.disconnect
+    (or add_in_road, remove_in_road, add_out_road and remove_out_road).
+    Removing a road moves the last road of the list into its place. Code
+    that modifies them directly must call invalidate_index afterwards.
     """
 
+    __slots__ = ['name', 'in_rds', 'out_rds', 'schedule',
+                 '_in_pos', '_out_pos', '_rds_from', '_rds_to']
+
     def __init__(self, name,
                  in_rds: List[Road] = None,
                  out_rds: List[Road] = None,
@@ -28,21 +42,78 @@ class Junction:
             assert (len(in_rds) == len(duration))
             self.schedule: Schedule = PeriodicSchedule(duration)
         else:
-            self.schedule = Schedule(self)
+            self.schedule = _DEFAULT_SCHEDULE
+
+        # Position of each road in in_rds/out_rds, and roads by origin/exit,
+        # built the first time they are needed
+        self.invalidate_index()
 
-    def tick(self, t):
-        in_rd = self.in_rds[self.schedule.get_incoming_at(t)]
-        car = in_rd.dequeue()
+    def tick(self, t, fifo=True):
+        idx = self.schedule.get_incoming_at(t)
+        if idx is None:
+            return
+        car = self.in_rds[idx].dequeue(fifo)
         if car:
             car.advance()
 
     def get_rd_to(self, junction):
-        road = next(filter(lambda x: x.exit == junction, self.out_rds))
-        return road
+        self._reindex()
+        return next(iter(self._rds_to.get(junction, ())))
 
     def get_rd_from(self, junction):
-        road = next(filter(lambda x: x.origin == junction, self.in_rds))
-        return road
+        self._reindex()
+        return next(iter(self._rds_from.get(junction, ())))
+
+    def add_in_road(self, road: Road):
+        self._reindex()
+        self._in_pos[road] = len(self.in_rds)
+        self.in_rds.append(road)
+        self._rds_from.setdefault(road.origin, []).append(road)
+
+    def add_out_road(self, road: Road):
+        self._reindex()
+        self._out_pos[road] = len(self.out_rds)
+        self.out_rds.append(road)
+        self._rds_to.setdefault(road.exit, []).append(road)
+
+    def remove_in_road(self, road: Road):
+        """ Remove road from in_rds in O(1), moving the last road into its place """
+        self._reindex()
+        swap_remove(self.in_rds, self._in_pos, road)
+        Junction._remove_from(self._rds_from, road.origin, road)
+
+    def remove_out_road(self, road: Road):
+        """ Remove road from out_rds in O(1), moving the last road into its place """
+        self._reindex()
+        swap_remove(self.out_rds, self._out_pos, road)
+        Junction._remove_from(self._rds_to, road.exit, road)
+
+    def invalidate_index(self):
+        """ Rebuild the indices when next needed, after in_rds or out_rds were modified directly """
+        self._in_pos = None
+        self._out_pos = None
+        self._rds_from = None
+        self._rds_to = None
+
+    @staticmethod
+    def _remove_from(rds_by_junction, junction, road):
+        rds = rds_by_junction[junction]
+        rds.remove(road)
+        if not rds:
+            del rds_by_junction[junction]
+
+    def _reindex(self):
+        """ Build the indices if they are not up to date (see invalidate_index) """
+        if self._in_pos is None:
+            self._in_pos = {road: i for i, road in enumerate(self.in_rds)}
+            self._rds_from = {}
+            for road in self.in_rds:
+                self._rds_from.setdefault(road.origin, []).append(road)
+        if self._out_pos is None:
+            self._out_pos = {road: i for i, road in enumerate(self.out_rds)}
+            self._rds_to = {}
+            for road in self.out_rds:
+                self._rds_to.setdefault(road.exit, []).append(road)
 
     def __str__(self):
         return f'Junction<{self.name}>'
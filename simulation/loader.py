@@ -0,0 +1,116 @@
+import hashlib
+import os
+
+import numpy as np
+
+
+class TextInput:
+    """
+    Google Hash Code input file parsed into arrays, with street names interned
+    to integer road ids (the order in which the streets are listed)
+
+    Attributes
+    ----------
+    duration: duration of the simulation
+    junction_num: number of junctions
+    bonus: bonus points for each car that reaches its destination in time
+    road_names: name of each road
+    road_origin: starting junction of each road
+    road_exit: ending junction of each road
+    road_length: length of each road
+    route_offsets: start of each car's route in route_roads (CSR offsets)
+    route_roads: road ids of all routes, concatenated
+    """
+
+    _fields = ['road_names', 'road_origin', 'road_exit', 'road_length',
+               'route_offsets', 'route_roads']
+
+    def __init__(self, duration, junction_num, bonus, road_names, road_origin,
+                 road_exit, road_length, route_offsets, route_roads):
+        self.duration = duration
+        self.junction_num = junction_num
+        self.bonus = bonus
+        self.road_names = road_names
+        self.road_origin = road_origin
+        self.road_exit = road_exit
+        self.road_length = road_length
+        self.route_offsets = route_offsets
+        self.route_roads = route_roads
+
+    @property
+    def road_num(self):
+        return len(self.road_length)
+
+    @property
+    def car_num(self):
+        return len(self.route_offsets) - 1
+
+    def get_route(self, i):
+        return self.route_roads[self.route_offsets[i]:self.route_offsets[i + 1]]
+
+    @staticmethod
+    def parse(filepath):
+        """ Parse a Hash Code input file, tokenizing each section in bulk """
+        with open(filepath, 'r') as f:
+            lines = f.read().splitlines()
+
+        duration, junction_num, road_num, car_num, bonus = tuple(map(int, lines[0].split()))
+
+        road_tokens = ' '.join(lines[1:road_num + 1]).split()
+        assert len(road_tokens) == 4 * road_num
+        road_origin = np.array(road_tokens[0::4], dtype=np.int64)
+        road_exit = np.array(road_tokens[1::4], dtype=np.int64)
+        road_names = road_tokens[2::4]
+        road_length = np.array(road_tokens[3::4], dtype=np.int64)
+        road_name_idx_dict = {name: i for i, name in enumerate(road_names)}
+        assert len(road_name_idx_dict) == road_num
+
+        route_len = np.zeros(car_num, dtype=np.int64)
+        route_names = []
+        for i, line in enumerate(lines[road_num + 1:road_num + car_num + 1]):
+            line = line.split()
+            assert len(line) == int(line[0]) + 1
+            route_len[i] = len(line) - 1
+            route_names.extend(line[1:])
+        assert len(route_len) == car_num
+        route_offsets = np.zeros(car_num + 1, dtype=np.int64)
+        np.cumsum(route_len, out=route_offsets[1:])
+        route_roads = np.fromiter(map(road_name_idx_dict.__getitem__, route_names),
+                                  dtype=np.int64, count=len(route_names))
+
+        return TextInput(duration, junction_num, bonus, np.array(road_names),
+                         road_origin, road_exit, road_length, route_offsets, route_roads)
+
+    @staticmethod
+    def load(filepath, use_cache=True):
+        """
+        Parse a Hash Code input file, or load it from the binary cache written
+        next to it by a previous call (keyed by the hash of the file)
+        """
+        if not use_cache:
+            return TextInput.parse(filepath)
+
+        cache_path = TextInput.get_cache_path(filepath)
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as data:
+                header = data['header']
+                return TextInput(int(header[0]), int(header[1]), int(header[2]),
+                                 *[data[field] for field in TextInput._fields])
+
+        text_input = TextInput.parse(filepath)
+        text_input.save(cache_path)
+        return text_input
+
+    @staticmethod
+    def get_cache_path(filepath):
+        with open(filepath, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:16]
+        return f'{filepath}.{digest}.npz'
+
+    def save(self, filepath):
+        # Write to a temporary file first, so that concurrent loaders never
+        # see a partially written cache
+        tmp_path = f'{filepath}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, header=np.array([self.duration, self.junction_num, self.bonus]),
+                 **{field: getattr(self, field) for field in TextInput._fields})
+        os.replace(tmp_path, filepath)
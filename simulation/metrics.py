@@ -0,0 +1,172 @@
+import csv
+import glob
+import os
+
+import numpy as np
+
+# Columns of every sample, the per-junction ones last
+SCALAR_COLUMNS = ['clock', 'reward', 'finished', 'queued', 'throughput']
+JUNCTION_COLUMNS = ['junction_queued', 'junction_throughput']
+
+
+class MetricsRecorder:
+    """
+    Samples a run of Simulator.simulate (or VectorizedSimulator.simulate)
+    every interval ticks, and passes each sample to a callback, so that long
+    runs can be followed without keeping their history
+
+    A sample is a dict of:
+    - clock: tick at which it was taken (also taken at the end of the run)
+    - reward: total reward so far
+    - finished: number of cars past the last junction of their route
+    - queued: number of cars queued
+    - throughput: number of cars that went through a junction since the
+      previous sample
+    - junction_queued, junction_throughput: the same per junction, for the
+      junctions sampled
+
+    Samples are computed from the route index of every car and the queue
+    length of every road, so the ticks in between cost nothing.
+
+    Attributes
+    ----------
+    callback: function called with each sample, e.g. a MetricsWriter
+    interval: number of ticks between samples
+    junctions: ids of the junctions whose columns are sampled, None for all
+    """
+
+    def __init__(self, callback, interval=1, junctions=None):
+        self.callback = callback
+        self.interval = interval
+        self.junctions = junctions
+        self._sim_len = None
+        self._route_offsets = None
+        self._route_len = None
+        self._crossed_junction = None
+        self._junction_num = None
+        self._road_junction = None
+        self._idx = None
+
+    def start(self, simulator):
+        """ Called by the simulator before its first tick """
+        from simulation.engine import VectorizedSimulator
+        if isinstance(simulator, VectorizedSimulator):
+            assert simulator.scenario_num == 1, 'Only single runs can be recorded'
+            compiled = simulator
+        else:
+            compiled = VectorizedSimulator.from_simulator(simulator)
+        self._sim_len = simulator.sim_len
+        self._route_offsets = compiled.route_offsets[:-1]
+        self._route_len = np.diff(compiled.route_offsets)
+        self._junction_num = compiled.junction_num
+        self._road_junction = compiled._road_junction
+        # Junction at the end of every road of every route
+        self._crossed_junction = compiled._road_junction[compiled.route_roads]
+        self._idx = simulator.get_route_idx().copy()
+
+    def get_next_sample(self, clock):
+        """ Tick of the first sample after clock """
+        return min((clock // self.interval + 1) * self.interval, self._sim_len)
+
+    def observe(self, simulator):
+        """ Called by the simulator after every tick (or step of several ticks) """
+        clock = simulator.clock
+        if clock % self.interval and clock < self._sim_len:
+            return
+        idx = simulator.get_route_idx()
+        crossed = idx - self._idx
+        # Position on the routes of every road left since the last sample
+        positions = np.repeat(self._route_offsets + self._idx - np.cumsum(crossed) + crossed,
+                              crossed) + np.arange(crossed.sum())
+        junction_throughput = np.bincount(self._crossed_junction[positions],
+                                          minlength=self._junction_num)
+        queue_len = simulator.get_queue_lengths()
+        junction_queued = np.bincount(self._road_junction, weights=queue_len,
+                                      minlength=self._junction_num).astype(np.int64)
+        self._idx = idx.copy()
+
+        if self.junctions is not None:
+            junction_queued = junction_queued[self.junctions]
+            junction_throughput = junction_throughput[self.junctions]
+        self.callback({'clock': clock,
+                       'reward': simulator.get_reward(),
+                       'finished': int((idx >= self._route_len).sum()),
+                       'queued': int(queue_len.sum()),
+                       'throughput': int(crossed.sum()),
+                       'junction_queued': junction_queued,
+                       'junction_throughput': junction_throughput})
+
+
+class MetricsWriter:
+    """
+    Callback for MetricsRecorder that appends the samples to disk, holding
+    at most chunk_size of them in memory
+
+    In npy format, path is a directory holding one file per column and chunk
+    (e.g. queued.000003.npy), which load puts back together. In csv format,
+    path is a single CSV file with a column per junction sampled for the
+    junction columns (e.g. junction_queued_12 for the 13th junction
+    sampled). Writing to an existing path appends to it.
+
+    Attributes
+    ----------
+    path: directory (npy) or file (csv) written to
+    format: 'npy' or 'csv'
+    chunk_size: number of samples buffered before they are written
+    """
+
+    def __init__(self, path, format='npy', chunk_size=1024):
+        assert format in ['npy', 'csv']
+        self.path = path
+        self.format = format
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._chunk = 0
+        if format == 'npy':
+            os.makedirs(path, exist_ok=True)
+            self._chunk = len(glob.glob(os.path.join(path, 'clock.*.npy')))
+
+    def __call__(self, sample):
+        self._buffer.append(sample)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self.format == 'npy':
+            for column in SCALAR_COLUMNS + JUNCTION_COLUMNS:
+                np.save(os.path.join(self.path, f'{column}.{self._chunk:06d}.npy'),
+                        np.array([sample[column] for sample in self._buffer]))
+            self._chunk += 1
+        else:
+            junction_num = len(self._buffer[0]['junction_queued'])
+            write_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(SCALAR_COLUMNS + [f'{column}_{i}'
+                                                      for column in JUNCTION_COLUMNS
+                                                      for i in range(junction_num)])
+                for sample in self._buffer:
+                    writer.writerow([sample[column] for column in SCALAR_COLUMNS]
+                                    + [value for column in JUNCTION_COLUMNS
+                                       for value in sample[column].tolist()])
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def load(path, columns=None):
+        """ Every sample written to an npy directory, as one array per column """
+        columns = columns or SCALAR_COLUMNS + JUNCTION_COLUMNS
+        return {column: np.concatenate([np.load(chunk) for chunk in
+                                        sorted(glob.glob(os.path.join(path, f'{column}.*.npy')))])
+                for column in columns}
@@ -1,4 +1,3 @@
-import copy
 import random
 import re
 from typing import List
@@ -10,6 +9,7 @@ from deprecated import deprecated
 
 from simulation.junction import Junction
 from simulation.road import Road
+from simulation.util import swap_remove
 
 
 class Network:
@@ -21,44 +21,103 @@ class Network:
     ----------
     junctions: junctions in the network
     roads: roads in the network
+    version: number of roads added or removed through connect and
+             remove_road, so that compiled copies of the network can tell
+             whether they are out of date
     """
 
     def __init__(self, junctions: List[Junction] = None, roads: List[Road] = None):
         self.junctions = junctions or []
         self.roads = roads or []
+        self._road_pos = None
+        self.version = 0
+
+    def connect(self, origin: Junction, exit: Junction, length, name=None):
+        """ Add a road from origin to exit """
+        self._reindex()
+        road = Road.connect(origin, exit, length, name)
+        self._road_pos[road] = len(self.roads)
+        self.roads.append(road)
+        self.version += 1
+        return road
+
+    def remove_road(self, road: Road):
+        """ Remove a road in O(1), moving the last road of roads into its place """
+        self._reindex()
+        road.disconnect()
+        swap_remove(self.roads, self._road_pos, road)
+        self.version += 1
+
+    def invalidate_index(self):
+        """ Rebuild the position of each road when next needed, after modifying roads directly """
+        self._road_pos = None
+
+    def _reindex(self):
+        """ Build the position of each road if it is not up to date (see invalidate_index) """
+        if self._road_pos is None:
+            self._road_pos = {road: i for i, road in enumerate(self.roads)}
 
     def transform(self, k):
+        """
+        Rewrite the network so that every junction has in-degree k: junctions
+        with more in-roads have groups of k of them merged through auxiliary
+        junctions, connected to them by roads of length 0, and junctions with
+        fewer get parallel copies of their in-roads (or k self-loops of
+        length 0 if they have none)
+        """
         aux_id = 0
-        for junction in self.junctions:
-            if len(junction.in_rds) == 0:
-                roads = [Road.connect(junction, junction, 0) for _ in range(k)]
-                self.roads.extend(roads)
-            elif len(junction.in_rds) < k:
-                in_nodes = list(map(lambda x: x.origin, junction.in_rds))
-                while len(junction.in_rds) < k:
-                    for node in in_nodes:
-                        if len(junction.in_rds) >= k:
-                            break
-                        else:
-                            self.roads.append(Road.connect(node, junction))
-            elif len(junction.in_rds) > k:
-                in_nodes = list(map(lambda x: x.origin, junction.in_rds))
+        for junction in list(self.junctions):
+            if len(junction.in_rds) > k:
+                assert k > 1, 'in-roads can only be merged in groups of at least 2'
+                in_nodes = [road.origin for road in junction.in_rds]
                 while len(in_nodes) > k:
                     rewrite_nodes = in_nodes[:k]
                     aux_node = Junction(f'aux_{aux_id}')
-                    self.roads.append(Road.connect(aux_node, junction, 0))
-                    in_nodes.append(aux_node)
+                    self.junctions.append(aux_node)
+                    self.connect(aux_node, junction, 0)
+                    in_nodes = in_nodes[k:] + [aux_node]
                     aux_id += 1
                     for node in rewrite_nodes:
                         road = junction.get_rd_from(node)
-                        self.roads.remove(road)
-                        junction.in_rds.remove(road)
-                        node.out_rds.remove(road)
-                        self.roads.append(Road.connect(node, aux_node, road.length))
+                        self.remove_road(road)
+                        self.connect(node, aux_node, road.length)
+
+            if len(junction.in_rds) == 0:
+                for _ in range(k):
+                    self.connect(junction, junction, 0)
+            elif len(junction.in_rds) < k:
+                in_rds = list(junction.in_rds)
+                while len(junction.in_rds) < k:
+                    for road in in_rds:
+                        if len(junction.in_rds) >= k:
+                            break
+                        else:
+                            self.connect(road.origin, junction, road.length)
 
     @staticmethod
     def generate_random_network(junction_num, max_road_length=5,
-                                allow_cyclic=True):
+                                allow_cyclic=True, rng: np.random.Generator = None):
+        from simulation.arrays import NetworkArrays
+        return NetworkArrays.generate_random(junction_num, rng or Network._get_rng(),
+                                             max_road_length, allow_cyclic).to_network()
+
+    @staticmethod
+    def generate_ring_network(junction_num, max_road_length=5,
+                              rng: np.random.Generator = None):
+        from simulation.arrays import NetworkArrays
+        return NetworkArrays.generate_ring(junction_num, rng or Network._get_rng(),
+                                           max_road_length).to_network()
+
+    @staticmethod
+    @deprecated
+    def generate_random_network_legacy(junction_num, max_road_length=5, allow_cyclic=True):
+        """
+        generate_random_network as it was before NetworkArrays, drawing from
+        random, to reproduce the networks of plots/ for a given random.seed.
+        As then, origins are drawn from sets of junctions, whose order
+        follows the junctions' ids, so the same seed only gives the same
+        network as far as the objects are laid out in memory alike.
+        """
         network = Network()
         network.junctions = []
         network.roads = []
@@ -80,8 +139,7 @@ class Network:
                 for _ in range(2):
                     origin_junction = random.choice(list(isolated_choices))
                     length = random.randint(1, max_road_length)
-                    road = Road.connect(origin_junction, exit_junction, length)
-                    network.roads.append(road)
+                    network.connect(origin_junction, exit_junction, length)
                     isolated_choices.remove(origin_junction)
 
                     isolated_junctions.remove(origin_junction)
@@ -90,20 +148,17 @@ class Network:
                 for _ in range(2):
                     origin_junction = random.choice(list(connected_choices))
                     length = random.randint(1, max_road_length)
-                    road = Road.connect(origin_junction, exit_junction, length)
-                    network.roads.append(road)
+                    network.connect(origin_junction, exit_junction, length)
                     connected_choices.remove(origin_junction)
             else:
                 origin_junction_1 = random.choice(list(isolated_choices))
                 length = random.randint(1, max_road_length)
-                road = Road.connect(origin_junction_1, exit_junction, length)
-                network.roads.append(road)
+                network.connect(origin_junction_1, exit_junction, length)
                 isolated_choices.remove(origin_junction_1)
 
                 origin_junction_2 = random.choice(list(connected_choices))
                 length = random.randint(1, max_road_length)
-                road = Road.connect(origin_junction_2, exit_junction, length)
-                network.roads.append(road)
+                network.connect(origin_junction_2, exit_junction, length)
                 connected_choices.remove(origin_junction_2)
 
                 isolated_junctions.remove(origin_junction_1)
@@ -112,7 +167,9 @@ class Network:
         return network
 
     @staticmethod
-    def generate_ring_network(junction_num, max_road_length=5):
+    @deprecated
+    def generate_ring_network_legacy(junction_num, max_road_length=5):
+        """ generate_ring_network as it was before NetworkArrays, drawing from random """
         network = Network()
         network.junctions = []
         network.roads = []
@@ -126,11 +183,15 @@ class Network:
             next = network.junctions[(i + 1) % junction_num]
             for origin in [prev, next]:
                 length = random.randint(1, max_road_length)
-                road = Road.connect(origin, junction, length)
-                network.roads.append(road)
+                network.connect(origin, junction, length)
 
         return network
 
+    @staticmethod
+    def _get_rng():
+        """ Generator seeded from random, so that random.seed still applies """
+        return np.random.default_rng(random.getrandbits(64))
+
     @staticmethod
     def generate_from_networkx(G, max_road_length=5):
         network = Network()
@@ -147,13 +208,21 @@ class Network:
             origin = node_map[edge[0]]
             exit = node_map[edge[1]]
             length = random.randint(1, max_road_length)
-            road = Road.connect(origin, exit, length)
-            network.roads.append(road)
+            network.connect(origin, exit, length)
 
         return network
 
     @staticmethod
-    def generate_random_k_in(junction_num, k):
+    def generate_random_k_in(junction_num, k, max_road_length=5,
+                             rng: np.random.Generator = None):
+        from simulation.arrays import NetworkArrays
+        return NetworkArrays.generate_k_in(junction_num, k, rng or Network._get_rng(),
+                                           max_road_length).to_network()
+
+    @staticmethod
+    @deprecated
+    def generate_random_k_in_legacy(junction_num, k):
+        """ generate_random_k_in as it was before NetworkArrays, through networkx """
         G = nx.generators.directed.random_uniform_k_out_graph(junction_num, k, self_loops=False)
         nx.reverse(G, copy=False)
         return Network.generate_from_networkx(G)
@@ -0,0 +1,82 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Opt-in record of where the time of simulator runs goes
+
+    Simulators, evaluators and emulators hold a profiler attribute that is
+    None unless profiling is wanted, in which case they time their phases
+    (e.g. parse, reset, schedule, dequeue) and count their events (e.g.
+    ticks, dequeues, enqueues, idle_junctions) on it. Only a check of that
+    attribute is left on the hot paths otherwise. Phases may nest: e.g. the
+    objective phase of an evaluator includes the simulations it runs. A
+    profiler accumulates over any number of runs, and profilers can be
+    merged, e.g. to sum up every objective evaluation of an emulator session.
+
+    Attributes
+    ----------
+    times: total seconds spent in each phase
+    calls: number of times each phase was timed
+    counters: total of each counter
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name):
+        """ Time the enclosed block as (part of) phase name """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds, calls=1):
+        self.times[name] += seconds
+        self.calls[name] += calls
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def merge(self, other: 'Profiler'):
+        """ Add the times and counters of other to this profiler """
+        for name, seconds in other.times.items():
+            self.add_time(name, seconds, other.calls[name])
+        for name, n in other.counters.items():
+            self.count(name, n)
+        return self
+
+    def to_dict(self):
+        return {'times': dict(self.times), 'calls': dict(self.calls),
+                'counters': dict(self.counters)}
+
+    @staticmethod
+    def from_dict(profile):
+        profiler = Profiler()
+        profiler.times.update(profile['times'])
+        profiler.calls.update(profile['calls'])
+        profiler.counters.update(profile['counters'])
+        return profiler
+
+    def dump(self, path):
+        """ Write the profile to a JSON file """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'r') as f:
+            return Profiler.from_dict(json.load(f))
+
+    def __str__(self):
+        lines = [f'{name:>20}: {seconds:10.4f}s in {self.calls[name]} calls'
+                 for name, seconds in sorted(self.times.items(), key=lambda item: -item[1])]
+        lines += [f'{name:>20}: {n}' for name, n in sorted(self.counters.items())]
+        return '\n'.join(lines)
@@ -1,4 +1,5 @@
 from __future__ import annotations
+from collections import deque
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -14,33 +15,62 @@ class Road:
     ----------
     name: name of the road
     length: length of the road
-    queue: queue of cars waiting at the road
+    queue: cars waiting at the road, in the order they arrived (allocated
+           the first time it is needed)
     origin: starting junction of the road
     exit: ending junction of the road
     """
+
+    __slots__ = ['name', 'length', '_queue', 'origin', 'exit']
+
     def __init__(self, name, length, origin, exit):
         self.name = name
         self.length = length
-        self.queue = []
+        self._queue = None
         self.origin = origin
         self.exit = exit
 
-    def dequeue(self) -> Car:
-        return self.queue.pop() if self.queue else None
+    @property
+    def queue(self) -> deque:
+        if self._queue is None:
+            self._queue = deque()
+        return self._queue
+
+    @queue.setter
+    def queue(self, queue):
+        self._queue = deque(queue)
+
+    def get_queued(self):
+        """ Cars waiting at the road, without allocating an empty queue """
+        return self._queue or ()
+
+    def dequeue(self, fifo=True) -> Car:
+        """
+        Release the car that arrived first, or the one that arrived last if
+        fifo is False (as in the original simulator)
+        """
+        if not self._queue:
+            return None
+        return self._queue.popleft() if fifo else self._queue.pop()
 
     def enqueue(self, car: Car):
         self.queue.append(car)
 
     def reset(self):
-        self.queue = []
+        self._queue = None
 
     @staticmethod
     def connect(origin: Junction, exit: Junction, length, name=None):
         name = name or f'{origin.name}_{exit.name}'
         road = Road(name, length, origin, exit)
-        origin.out_rds.append(road)
-        exit.in_rds.append(road)
+        origin.add_out_road(road)
+        exit.add_in_road(road)
         return road
 
+    def disconnect(self):
+        """ Remove the road from its origin and exit junctions """
+        self.origin.remove_out_road(self)
+        self.exit.remove_in_road(self)
+
     def __str__(self):
         return f'Road<{self.name}>'
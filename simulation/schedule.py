@@ -3,9 +3,11 @@ from __future__ import annotations
 import random
 from typing import TYPE_CHECKING
 
+import numpy as np
+
 if TYPE_CHECKING:
     from simulation.junction import Junction
-from simulation.util import get_bin_idx
+from simulation.util import get_bin_table
 
 
 class Schedule:
@@ -15,11 +17,16 @@ class Schedule:
     Attributes
     ----------
     schedule: a function that takes in time and output which road the dequeue should occur
-              uses random sampling by default
+              uses random sampling by default. If none is given, the method
+              of the class is used, so that no closure is allocated.
     """
 
     def __init__(self, schedule=None):
-        self.schedule = schedule or (lambda _: 0)
+        if schedule is not None:
+            self.schedule = schedule
+
+    def schedule(self, t):
+        return 0
 
     def get_incoming_at(self, t):
         return self.schedule(t)
@@ -32,8 +39,103 @@ class PeriodicSchedule(Schedule):
     Attributes
     ----------
     schedule: same as parent class
+    duration: how long each incoming road stays green in a cycle
+    table: incoming road index at each t mod cycle_len, as util.get_bin_idx
+           would give it
+    cycle_len: length of a full cycle of the schedule
     """
 
     def __init__(self, duration):
         super().__init__()
-        self.schedule = lambda t: get_bin_idx(duration, t)
+        self.duration = duration
+        self._set_table(get_bin_table(duration))
+
+    def _set_table(self, table):
+        self.table = table
+        self.cycle_len = len(table)
+        # Indexing a list is much cheaper than a NumPy array for a single t
+        self._table = table.tolist()
+
+    def schedule(self, t):
+        return self.get_incoming_at(t)
+
+    def get_incoming_at(self, t):
+        return self._table[t % self.cycle_len]
+
+    def get_key(self):
+        """ Hashable key, equal for schedules with the same table """
+        return tuple(self.duration)
+
+    def get_phases(self):
+        """
+        Start and length within the cycle of the green phase of each index
+        of table, from -1 (the last in_rds) on: -1, 0, 1, ...
+        """
+        length = list(self.duration[-1:]) + list(self.duration[:-1])
+        start = np.cumsum([0] + length[:-1]).tolist()
+        return start, length
+
+    def get_coarse(self, tick_size):
+        """ Same schedule with its durations divided by tick_size, rounding up """
+        return PeriodicSchedule([-(-d // tick_size) for d in self.duration])
+
+
+class PhaseSchedule(PeriodicSchedule):
+    """
+    Represent a traffic light schedule that gives green to any of the incoming
+    roads, in any order, for their own duration (as in a Hash Code submission)
+
+    Attributes
+    ----------
+    phases: ordered (in_rds index, duration) pairs, each index at most once;
+            the roads left out, or with a duration of 0, are skipped
+    duration: duration of each in_rds index up to the last one in phases,
+              0 for the skipped ones
+    table, cycle_len: same as parent class (the indices are never -1). With
+                      no phases, the table is empty and no road is ever
+                      given green.
+    """
+
+    def __init__(self, phases):
+        Schedule.__init__(self)
+        self.phases = [(int(idx), int(duration)) for idx, duration in phases]
+        indices = [idx for idx, _ in self.phases]
+        assert len(set(indices)) == len(indices) and min(indices, default=0) >= 0
+        self.duration = [0] * (max(indices, default=-1) + 1)
+        for idx, duration in self.phases:
+            self.duration[idx] = duration
+        self._set_table(np.repeat(np.array(indices, dtype=np.int64),
+                                  [duration for _, duration in self.phases]))
+
+    def get_incoming_at(self, t):
+        """ in_rds index given green at t, None if there are no phases """
+        return self._table[t % self.cycle_len] if self.cycle_len else None
+
+    @staticmethod
+    def from_roads(junction: Junction, road_durations):
+        """ Schedule of junction from ordered (road, duration) pairs of its in_rds """
+        return PhaseSchedule([(junction.in_rds.index(road), duration)
+                              for road, duration in road_durations])
+
+    @staticmethod
+    def get_round_robin(durations):
+        """ Green for every in_rds in turn, in order, for its duration """
+        return PhaseSchedule(enumerate(durations))
+
+    def get_key(self):
+        return ('phases',) + tuple(self.phases)
+
+    def get_phases(self):
+        # No index is -1, so the first column stays empty
+        start = [0] * (len(self.duration) + 1)
+        length = [0] * (len(self.duration) + 1)
+        t = 0
+        for idx, duration in self.phases:
+            start[idx + 1] = t
+            length[idx + 1] = duration
+            t += duration
+        return start, length
+
+    def get_coarse(self, tick_size):
+        return PhaseSchedule([(idx, -(-duration // tick_size))
+                              for idx, duration in self.phases])
@@ -0,0 +1,408 @@
+import heapq
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from simulation.loader import TextInput
+from simulation.schedule import PhaseSchedule
+
+# Time of the events that never happen within the duration
+_NEVER = 1 << 62
+# What IncrementalHashCodeScorer.undo has to restore
+_SET_CROSS, _SET_ARRIVAL, _INSERT, _REMOVE, _SET_SCHEDULE = range(5)
+
+
+class HashCodeScorer:
+    """
+    Scores schedules with the semantics of the Google Hash Code 2021 judge,
+    rather than the distance travelled rewarded by Simulator:
+
+    - every car starts queued at the end of its first street, in input order
+    - each second, the first car queued on every street with a green light
+      crosses the intersection, and reaches the end of the next street
+      length seconds later, where it joins that street's queue
+    - a car that reaches the end of its last street finishes there, earning
+      the bonus plus one point for every second left until the duration
+
+    The run is stepped second by second for all the cars at once, on arrays:
+    each step lets the first car waiting on every green street cross. The
+    seconds at which no street with cars waiting is green are skipped in
+    bulk, up to the next green second of such a street (found by a binary
+    search over the green seconds of every street) or the next car reaching
+    the end of a street. Roads are given green as by
+    PeriodicSchedule.get_incoming_at. Cars whose route is a single street
+    have already reached its end, and finish at second 0.
+
+    Attributes
+    ----------
+    text_input: the Hash Code input
+    finish_time: second at which each car finished in the last run, -1 if it
+                 did not finish in time
+    """
+
+    def __init__(self, text_input: TextInput):
+        self.text_input = text_input
+        self.finish_time = np.full(text_input.car_num, -1, dtype=np.int64)
+
+        self._road_exit = text_input.road_exit.tolist()
+        self._road_length = text_input.road_length.tolist()
+        self._route_offsets = text_input.route_offsets.tolist()
+        self._route_roads = text_input.route_roads.tolist()
+        # Position of each road among the in_rds of its junction, which are
+        # in the order the roads are listed
+        order = np.argsort(text_input.road_exit, kind='stable')
+        exits = text_input.road_exit[order]
+        first = np.searchsorted(exits, exits)
+        road_slot = np.empty(text_input.road_num, dtype=np.int64)
+        road_slot[order] = np.arange(text_input.road_num) - first
+        self._road_slot = road_slot.tolist()
+        self._in_degree = np.bincount(text_input.road_exit,
+                                      minlength=text_input.junction_num).tolist()
+        # Roads into each junction in that order, from position _first_in
+        self._in_rds = order
+        self._first_in = np.searchsorted(exits, np.arange(text_input.junction_num))
+
+    @staticmethod
+    def from_text(filepath, use_cache=True):
+        return HashCodeScorer(TextInput.load(filepath, use_cache=use_cache))
+
+    def load_submission(self, filepath):
+        """
+        Schedules of a Hash Code submission file, as a PhaseSchedule per
+        junction (with no phases for the junctions it leaves out)
+        """
+        road_ids = {name: i for i, name in enumerate(self.text_input.road_names.tolist())}
+        with open(filepath, 'r') as f:
+            tokens = f.read().split()
+        schedules = [PhaseSchedule([]) for _ in range(self.text_input.junction_num)]
+        pos = 1
+        for _ in range(int(tokens[0])):
+            junction, phase_num = int(tokens[pos]), int(tokens[pos + 1])
+            names = tokens[pos + 2:pos + 2 + 2 * phase_num:2]
+            durations = tokens[pos + 3:pos + 3 + 2 * phase_num:2]
+            schedules[junction] = PhaseSchedule(
+                [(self._road_slot[road_ids[name]], int(duration))
+                 for name, duration in zip(names, durations)])
+            pos += 2 + 2 * phase_num
+        return schedules
+
+    def _get_green_ticks(self, schedules, road):
+        """ Cycle length and sorted seconds within the cycle where road is green """
+        junction = self._road_exit[road]
+        table = schedules[junction].table
+        table = np.where(table < 0, table + self._in_degree[junction], table)
+        return len(table), np.flatnonzero(table == self._road_slot[road]).tolist()
+
+    def _get_green_seconds(self, schedules):
+        """
+        Compiled schedules: the cycle length of the junction at the end of
+        each road (0 for no phases), where its table starts in green_roads,
+        green_roads (the road given green at every second of every cycle,
+        then -1), and the green seconds of all roads sorted by road, as
+        keys road * key_base + second (then _NEVER), with the first green
+        second of each road (-1 if it is never green)
+        """
+        text_input = self.text_input
+        tables = [schedules[i].table for i in range(text_input.junction_num)]
+        cycle_len = np.array([len(table) for table in tables], dtype=np.int64)
+        table_offset = np.zeros(text_input.junction_num, dtype=np.int64)
+        np.cumsum(cycle_len[:-1], out=table_offset[1:])
+        table_junction = np.repeat(np.arange(text_input.junction_num), cycle_len)
+        idx = np.concatenate(tables + [np.zeros(0, dtype=np.int64)]).astype(np.int64)
+        # Index -1 is the last in-road (see util.get_bin_idx)
+        idx = np.where(idx < 0, idx + np.array(self._in_degree)[table_junction], idx)
+        green_roads = np.append(self._in_rds[self._first_in[table_junction] + idx], -1)
+
+        road_cycle_len = cycle_len[text_input.road_exit]
+        road_offset = np.where(road_cycle_len > 0, table_offset[text_input.road_exit],
+                               len(green_roads) - 1)
+        key_base = int(cycle_len.max(initial=0)) + 1
+        green_keys = np.sort(green_roads[:-1] * key_base
+                             + np.arange(len(idx)) - table_offset[table_junction])
+        first_green = np.full(text_input.road_num, -1, dtype=np.int64)
+        key_road = green_keys // key_base
+        is_first = np.ones(len(green_keys), dtype=bool)
+        is_first[1:] = key_road[1:] != key_road[:-1]
+        first_green[key_road[is_first]] = green_keys[is_first] % key_base
+        return road_cycle_len, road_offset, green_roads, \
+            np.append(green_keys, _NEVER), key_base, first_green
+
+    def score(self, schedules):
+        """ Total score of the schedules (one per junction), see finish_time for each car """
+        text_input = self.text_input
+        duration = text_input.duration
+        bonus = text_input.bonus
+        road_length = text_input.road_length
+        route_roads = text_input.route_roads
+        road_cycle_len, road_offset, green_roads, green_keys, key_base, first_green = \
+            self._get_green_seconds(schedules)
+        cycle_mod = np.maximum(road_cycle_len, 1)
+
+        # Position of every car on the routes, and the second it reaches (or
+        # reached) the end of the street there, _NEVER once it finished
+        position = text_input.route_offsets[:-1].copy()
+        last = text_input.route_offsets[1:] - 1
+        ready = np.zeros(text_input.car_num, dtype=np.int64)
+        finish_time = np.full(text_input.car_num, -1, dtype=np.int64)
+        finished = position == last
+        finish_time[finished] = 0
+        ready[finished] = _NEVER
+        score = int(finished.sum()) * (bonus + duration)
+
+        t = 0
+        while t < duration:
+            waiting = np.flatnonzero(ready <= t)
+            road = route_roads[position[waiting]]
+            green = green_roads[road_offset[road] + t % cycle_mod[road]] == road
+            if green.any():
+                # The first car of each green street crosses, possibly in the
+                # second it reached the end: cars queue in the order they
+                # reached the end, by car id at the same second
+                cars, road = waiting[green], road[green]
+                order = np.lexsort((cars, ready[cars], road))
+                road = road[order]
+                is_first = np.ones(len(road), dtype=bool)
+                is_first[1:] = road[1:] != road[:-1]
+                cars = cars[order[is_first]]
+                position[cars] += 1
+                ready[cars] = t + road_length[route_roads[position[cars]]]
+                finished = cars[position[cars] == last[cars]]
+                in_time = finished[ready[finished] <= duration]
+                score += int((bonus + duration - ready[in_time]).sum())
+                finish_time[in_time] = ready[in_time]
+                ready[finished] = _NEVER
+                t += 1
+                continue
+
+            # Skip to the next green second of a street with cars waiting, or
+            # to the next car reaching the end of a street
+            x = t % cycle_mod[road]
+            key = green_keys[np.searchsorted(green_keys, road * key_base + x)]
+            first = first_green[road]
+            wait = np.where(key // key_base == road, key % key_base - x,
+                            road_cycle_len[road] - x + first)[first >= 0]
+            driving = ready[ready > t]
+            t = min(t + int(wait.min()) if len(wait) else duration,
+                    int(driving.min()) if len(driving) else duration)
+
+        self.finish_time = finish_time
+        return score
+
+
+class IncrementalHashCodeScorer(HashCodeScorer):
+    """
+    HashCodeScorer that re-scores a change to the schedule of one junction
+    by re-simulating only the events that it changes, for local search
+
+    The cars queued on a street cross in the order they reached its end
+    (by car id if at the same second), each at the first green second from
+    when it arrived or from the second after the car before it crossed,
+    whichever is later. The whole run is therefore determined by when each
+    car reaches the end of each street of its route, and when it crosses.
+    update recomputes the crossings of the streets into the junction, and
+    follows every crossing that moved to the street its car takes next, in
+    time order, until nothing changes any more. Its cost grows with the
+    number of events that changed rather than with the whole run. The last
+    update can be undone.
+
+    Attributes
+    ----------
+    schedules: schedules of the last run, one per junction
+    current_score: score of the last run
+    junction_rds: roads into each junction, in the order their schedules
+                  give them green
+    """
+
+    def __init__(self, text_input: TextInput):
+        super().__init__(text_input)
+        self.schedules = None
+        self.current_score = 0
+
+        route_offsets = text_input.route_offsets
+        self._car_of = np.repeat(np.arange(text_input.car_num),
+                                 np.diff(route_offsets)).tolist()
+        is_last = np.zeros(len(text_input.route_roads), dtype=bool)
+        is_last[route_offsets[1:] - 1] = True
+        self._is_last = is_last.tolist()
+        order = np.argsort(text_input.road_exit, kind='stable')
+        bounds = np.searchsorted(text_input.road_exit[order],
+                                 np.arange(text_input.junction_num + 1)).tolist()
+        order = order.tolist()
+        self.junction_rds = [order[bounds[i]:bounds[i + 1]]
+                              for i in range(text_input.junction_num)]
+
+        # Second at which the car at each position of the routes reaches the
+        # end of the road there, and crosses the junction at that end
+        self._arrival = None
+        self._cross = None
+        # (arrival, car, position) of the cars queued on each road, in order
+        self._queues = None
+        self._green = None
+        self._journal = []
+        self._pending = []
+        self._dirty_from = {}
+        self._dirty_to = {}
+
+    @staticmethod
+    def from_text(filepath, use_cache=True):
+        return IncrementalHashCodeScorer(TextInput.load(filepath, use_cache=use_cache))
+
+    def score(self, schedules):
+        """ Total score of the schedules (one per junction), simulated from scratch """
+        text_input = self.text_input
+        self.schedules = [schedules[i] for i in range(text_input.junction_num)]
+        self.current_score = 0
+        self.finish_time = np.full(text_input.car_num, -1, dtype=np.int64)
+        self._arrival = [_NEVER] * len(self._route_roads)
+        self._cross = [_NEVER] * len(self._route_roads)
+        self._queues = [[] for _ in range(text_input.road_num)]
+        self._green = [None] * text_input.road_num
+        for car in range(text_input.car_num):
+            position = self._route_offsets[car]
+            road = self._route_roads[position]
+            self._arrival[position] = 0
+            if self._is_last[position]:
+                # Already at the end of the only street of its route
+                self.current_score += text_input.bonus + text_input.duration
+                self.finish_time[car] = 0
+                continue
+            self._queues[road].append((0, car, position))
+            self._mark(road, 0, _NEVER)
+        self._propagate()
+        self._journal = []
+        return self.current_score
+
+    def update(self, junction, schedule):
+        """ Change the schedule of one junction, and return the new total score """
+        self._journal = [(_SET_SCHEDULE, junction, self.schedules[junction],
+                          self.current_score)]
+        self.schedules[junction] = schedule
+        for road in self.junction_rds[junction]:
+            self._green[road] = None
+            if self._queues[road]:
+                self._mark(road, 0, _NEVER)
+        self._propagate()
+        return self.current_score
+
+    def undo(self):
+        """ Revert the last update """
+        for entry in reversed(self._journal):
+            kind = entry[0]
+            if kind == _SET_CROSS:
+                self._cross[entry[1]] = entry[2]
+            elif kind == _SET_ARRIVAL:
+                position, arrival = entry[1], entry[2]
+                self._arrival[position] = arrival
+                if self._is_last[position]:
+                    self.finish_time[self._car_of[position]] = \
+                        arrival if arrival != _NEVER else -1
+            elif kind == _INSERT:
+                queue = self._queues[entry[1]]
+                del queue[bisect_left(queue, entry[2])]
+            elif kind == _REMOVE:
+                insort(self._queues[entry[1]], entry[2])
+            else:
+                junction = entry[1]
+                self.schedules[junction] = entry[2]
+                self.current_score = entry[3]
+                for road in self.junction_rds[junction]:
+                    self._green[road] = None
+        self._journal = []
+
+    def _mark(self, road, start, end):
+        """ Recompute the crossings of road for the cars that arrived from start to end """
+        dirty_from = self._dirty_from
+        if road not in dirty_from:
+            dirty_from[road] = start
+            self._dirty_to[road] = end
+            heapq.heappush(self._pending, (start, road))
+            return
+        if start < dirty_from[road]:
+            dirty_from[road] = start
+            heapq.heappush(self._pending, (start, road))
+        if end > self._dirty_to[road]:
+            self._dirty_to[road] = end
+
+    def _propagate(self):
+        """ Recompute the marked roads in time order, until nothing changes """
+        duration = self.text_input.duration
+        arrivals = self._arrival
+        crosses = self._cross
+        journal = self._journal
+        pending = self._pending
+        dirty_from = self._dirty_from
+        while pending:
+            start, road = heapq.heappop(pending)
+            if dirty_from.get(road) != start:
+                continue
+            del dirty_from[road]
+            end = self._dirty_to.pop(road)
+            if self._green[road] is None:
+                self._green[road] = self._get_green_ticks(self.schedules, road)
+            cycle_len, ticks = self._green[road]
+
+            queue = self._queues[road]
+            k = bisect_left(queue, (start,))
+            ready = crosses[queue[k - 1][2]] + 1 if k else 0
+            for arrival, car, position in queue[k:]:
+                if arrivals[position] != arrival:
+                    # Left the queue while it was being recomputed
+                    continue
+                t = arrival if arrival > ready else ready
+                if t >= duration or not ticks:
+                    cross = _NEVER
+                else:
+                    x = t % cycle_len
+                    i = bisect_left(ticks, x)
+                    t += ticks[i] - x if i < len(ticks) else cycle_len - x + ticks[0]
+                    cross = t if t < duration else _NEVER
+                if cross != crosses[position]:
+                    journal.append((_SET_CROSS, position, crosses[position]))
+                    crosses[position] = cross
+                    self._set_arrival(position + 1, car, cross)
+                elif arrival > end:
+                    break
+                ready = cross + 1
+
+    def _set_arrival(self, position, car, cross):
+        """ Move the arrival at position after the car crossed into its road at cross """
+        duration = self.text_input.duration
+        road = self._route_roads[position]
+        is_last = self._is_last[position]
+        arrival = _NEVER
+        if cross != _NEVER:
+            arrival = cross + self._road_length[road]
+            if arrival > duration or (arrival == duration and not is_last):
+                arrival = _NEVER
+        old = self._arrival[position]
+        if arrival == old:
+            return
+        self._journal.append((_SET_ARRIVAL, position, old))
+        self._arrival[position] = arrival
+
+        if is_last:
+            bonus = self.text_input.bonus
+            if old != _NEVER:
+                self.current_score -= bonus + duration - old
+            if arrival != _NEVER:
+                self.current_score += bonus + duration - arrival
+            self.finish_time[car] = arrival if arrival != _NEVER else -1
+            return
+
+        queue = self._queues[road]
+        if old != _NEVER:
+            key = (old, car, position)
+            del queue[bisect_left(queue, key)]
+            self._journal.append((_REMOVE, road, key))
+        if arrival != _NEVER:
+            key = (arrival, car, position)
+            insort(queue, key)
+            self._journal.append((_INSERT, road, key))
+            self._mark(road, min(arrival, old), arrival if old == _NEVER else max(arrival, old))
+        else:
+            self._mark(road, old, old)
+            # The car no longer gets here, so it does not cross either
+            if self._cross[position] != _NEVER:
+                self._journal.append((_SET_CROSS, position, self._cross[position]))
+                self._cross[position] = _NEVER
+                self._set_arrival(position + 1, car, _NEVER)
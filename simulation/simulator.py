@@ -1,121 +1,303 @@
+import time
 from typing import List
 import numpy as np
 import matplotlib.pyplot as plt
 
+from simulation.arrays import NetworkArrays
 from simulation.car import Car
-from simulation.junction import Junction
-from simulation.road import Road
+from simulation.control import Controller
+from simulation.demand import ODDemand
+from simulation.loader import TextInput
+from simulation.metrics import MetricsRecorder
 from simulation.network import Network
-from simulation.schedule import PeriodicSchedule
+from simulation.profiler import Profiler
+from simulation.schedule import PeriodicSchedule, PhaseSchedule
+
+
+class SimulatorState:
+    """
+    Copy of the dynamic state of a simulation, stored in flat arrays indexed
+    by the position of each car in Simulator.cars and of each road in
+    Network.roads
+
+    Attributes
+    ----------
+    clock: current time
+    idx: index of each car's current road on its route
+    dist: how far on its current road each car has travelled
+    reward: reward collected by each car
+    top: car last enqueued on each road, -1 if none
+    below: car enqueued on the same road before each queued car, -1 if none
+    """
+
+    def __init__(self, clock, idx, dist, reward, top, below):
+        self.clock = clock
+        self.idx = idx
+        self.dist = dist
+        self.reward = reward
+        self.top = top
+        self.below = below
 
 
 class Simulator:
-    def __init__(self, network: Network = None, cars: List[Car] = None, sim_len=100):
+    """
+    Attributes
+    ----------
+    network: road network
+    cars: cars driving on the network
+    sim_len: number of ticks to simulate
+    clock: current time
+    fifo: whether road queues release cars in arrival order, otherwise the
+          last car to arrive goes first (as in the original simulator)
+    initial_state: state restored by reset, if any
+    profiler: profiler that runs are timed and counted on, None (the
+              default) not to profile
+    metrics: recorder that simulate streams samples to, None (the default)
+             not to record any
+    """
+
+    def __init__(self, network: Network = None, cars: List[Car] = None, sim_len=100,
+                 fifo=True):
         self.network = network
         self.cars = cars
         self.sim_len = sim_len
         self.clock = 0
+        self.fifo = fifo
+        self.initial_state: SimulatorState = None
+        self.profiler: Profiler = None
+        self.metrics: MetricsRecorder = None
+        # VectorizedSimulator compiled by simulate_batch and get_fidelity, and
+        # the network, cars and network version it was compiled from
+        self._compiled = None
+        self._compiled_from = None
+
+    def initialize_from_text(self, filepath, use_cache=True):
+        # Google Hash Code input file contains bonus points for each car
+        # that reaches its destination before duration ends. In our
+        # simulation, this bonus is neglected.
+        start = time.perf_counter()
+        text_input = TextInput.load(filepath, use_cache=use_cache)
+        self.sim_len = text_input.duration
+        parsed = time.perf_counter()
+
+        # Initialize network
+        network = NetworkArrays(text_input.junction_num, text_input.road_origin,
+                                text_input.road_exit, text_input.road_length) \
+            .to_network(text_input.road_names.tolist())
 
-    def initialize_from_text(self, filepath):
-        network = Network()
-        with open(filepath, 'r') as f:
-            # Google Hash Code input file contains bonus points for each car
-            # that reaches its destination before duration ends. In our
-            # simulation, this bonus is neglected.
-
-            # Initialize network
-            network.junctions = []
-            network.roads = []
-            road_name_idx_dict = {}
-
-            duration, junction_num, road_num, car_num, _ = \
-                tuple(map(int, f.readline().strip().split()))
-            self.sim_len = duration
-
-            for i in range(junction_num):
-                network.junctions.append(Junction(name=f'junction_{i}'))
-
-            for i in range(road_num):
-                line = f.readline().strip().split()
-                origin_junction_idx = int(line[0])
-                exit_junction_idx = int(line[1])
-                road_name = line[2]
-                road_length = int(line[3])
-
-                origin_junction = network.junctions[origin_junction_idx]
-                exit_junction = network.junctions[exit_junction_idx]
-                road = Road(name=road_name, length=road_length,
-                            origin=origin_junction, exit=exit_junction)
-                assert road_name not in road_name_idx_dict
-                road_name_idx_dict[road_name] = i
-                network.roads.append(road)
-                origin_junction.out_rds.append(road)
-                exit_junction.in_rds.append(road)
-
-            # Initialize cars
-            cars = []
-            for i in range(car_num):
-                line = f.readline().strip().split()
-                assert len(line) == int(line[0]) + 1
-
-                route = []
-                for road_name in line[1:]:
-                    road_idx = road_name_idx_dict[road_name]
-                    road = network.roads[road_idx]
-                    route.append(road)
-
-                car = Car(name=f'car_{i}', route=route)
-                cars.append(car)
-
-                # Each car starts at the end of the first street (i.e. it waits
-                # for the green light to move to the next street)
-                car.dist = route[0].length
-                route[0].enqueue(car)
-
-            # Pass network and cars to simulation instance
-            self.network = network
-            self.cars = cars
-
-    def initialize_random_network(self, junction_num, car_num, allow_cyclic=True):
-        self.network = Network.generate_random_network(junction_num=junction_num,
-                                                       allow_cyclic=allow_cyclic)
-        self.cars = [Car(i).gen_route(self.network) for i in range(car_num)]
-
-    def initialize_random_ring(self, junction_num, car_num):
-        self.network = Network.generate_ring_network(junction_num=junction_num)
-        self.cars = [Car(i).gen_route(self.network) for i in range(car_num)]
+        # Initialize cars
+        cars = Car.from_routes(network.roads, text_input.route_offsets, text_input.route_roads,
+                               [f'car_{i}' for i in range(text_input.car_num)])
+        for car in cars:
+            # Each car starts at the end of the first street (i.e. it waits
+            # for the green light to move to the next street)
+            road = car.get_road()
+            car.dist = road.length
+            road.enqueue(car)
+
+        # Pass network and cars to simulation instance
+        self.network = network
+        self.cars = cars
+        self._compiled = None
+        self.initial_state = self.snapshot()
+        if self.profiler is not None:
+            self.profiler.add_time('parse', parsed - start)
+            self.profiler.add_time('build', time.perf_counter() - parsed)
+
+    def initialize_random_network(self, junction_num, car_num, allow_cyclic=True,
+                                  rng: np.random.Generator = None, demand: ODDemand = None,
+                                  legacy=False):
+        """
+        Random network and cars, drawn from rng (seeded from random unless
+        given). With legacy, the network and routes are instead drawn from
+        random one object at a time, as before NetworkArrays, which
+        reproduces the networks of plots/ for a given random.seed.
+        """
+        if legacy:
+            self._initialize_objects(Network.generate_random_network_legacy(
+                junction_num, allow_cyclic=allow_cyclic), car_num)
+            return
+        rng = rng or Network._get_rng()
+        self._initialize_random_cars(
+            NetworkArrays.generate_random(junction_num, rng, allow_cyclic=allow_cyclic),
+            car_num, rng, demand)
+
+    def initialize_random_ring(self, junction_num, car_num, rng: np.random.Generator = None,
+                               demand: ODDemand = None, legacy=False):
+        """ Random ring network and cars, see initialize_random_network """
+        if legacy:
+            self._initialize_objects(Network.generate_ring_network_legacy(junction_num), car_num)
+            return
+        rng = rng or Network._get_rng()
+        self._initialize_random_cars(NetworkArrays.generate_ring(junction_num, rng),
+                                     car_num, rng, demand)
+
+    def _initialize_random_cars(self, network_arrays, car_num, rng, demand=None):
+        """
+        Build the network, and cars on routes drawn as by Car.gen_route, or
+        from demand if given (e.g. an ODDemand)
+        """
+        self.network = network_arrays.to_network()
+        route_offsets, route_roads = Simulator._generate_routes(network_arrays, car_num, rng,
+                                                                demand)
+        self.cars = Car.from_routes(self.network.roads, route_offsets, route_roads)
+        self._compiled = None
+        for car in self.cars:
+            car.dist = car.get_road().length
+
+    def _initialize_objects(self, network, car_num):
+        """ Take the network, and cars on routes drawn by Car.gen_route """
+        self.network = network
+        self.cars = [Car(i).gen_route(network) for i in range(car_num)]
+        self._compiled = None
+
+    @staticmethod
+    def _generate_routes(network_arrays, car_num, rng, demand):
+        if demand is None:
+            return network_arrays.generate_routes(car_num, rng)
+        return demand.generate_routes(network_arrays, car_num, rng)
 
     def tick(self):
+        if self.profiler is not None:
+            self._tick_profiled()
+            return
         for junction in self.network.junctions:
-            junction.tick(self.clock)
+            junction.tick(self.clock, self.fifo)
+        for car in self.cars:
+            car.tick()
+        self.clock += 1
+
+    def _tick_profiled(self):
+        """ Same as tick, timing the schedule lookups, junctions and cars apart """
+        profiler = self.profiler
+        start = time.perf_counter()
+        in_rds = [junction.in_rds[idx] for junction in self.network.junctions
+                  for idx in [junction.schedule.get_incoming_at(self.clock)] if idx is not None]
+        looked_up = time.perf_counter()
+        dequeues = 0
+        for in_rd in in_rds:
+            car = in_rd.dequeue(self.fifo)
+            if car:
+                car.advance()
+                dequeues += 1
+        dequeued = time.perf_counter()
+        enqueues = 0
         for car in self.cars:
+            dist = car.dist
             car.tick()
+            # A car reaching the end of its road joins the queue there
+            if car.dist != dist and car.dist == car.get_road().length:
+                enqueues += 1
         self.clock += 1
 
+        profiler.add_time('schedule', looked_up - start)
+        profiler.add_time('junctions', dequeued - looked_up)
+        profiler.add_time('cars', time.perf_counter() - dequeued)
+        profiler.count('ticks')
+        profiler.count('dequeues', dequeues)
+        profiler.count('idle_junctions', len(in_rds) - dequeues)
+        profiler.count('enqueues', enqueues)
+
     def simulate(self, schedules):
         for i in range(len(self.network.junctions)):
             junction = self.network.junctions[i]
             schedule = schedules[i]
             junction.schedule = schedule
+        if self.metrics is not None:
+            self.metrics.start(self)
         for self.clock in range(self.sim_len):
             self.tick()
+            if self.metrics is not None:
+                self.metrics.observe(self)
+
+    def simulate_controlled(self, controller: Controller):
+        """ Simulate with the green roads decided at every tick by controller """
+        controller.reset(self)
+        if self.metrics is not None:
+            self.metrics.start(self)
+        for self.clock in range(self.sim_len):
+            start = time.perf_counter()
+            green = controller.get_green(self).tolist()
+            if self.profiler is not None:
+                self.profiler.add_time('control', time.perf_counter() - start)
+            for junction, idx in zip(self.network.junctions, green):
+                if 0 <= idx < len(junction.in_rds):
+                    car = junction.in_rds[idx].dequeue(self.fifo)
+                    if car:
+                        car.advance()
+            for car in self.cars:
+                car.tick()
+            self.clock += 1
+            if self.metrics is not None:
+                self.metrics.observe(self)
 
     def simulate_uniform(self, red_len, green_len):
+        self.simulate(self.get_uniform_schedules(red_len, green_len))
+
+    def simulate_distinct(self, red_lens, green_lens):
+        self.simulate(self.get_distinct_schedules(red_lens, green_lens))
+
+    def simulate_preset(self, red_lens, green_lens, modes):
+        self.simulate(self.get_preset_schedules(red_lens, green_lens, modes))
+
+    def simulate_batch(self, schedule_matrix, schedule_type='uniform', mode_num=2):
+        """
+        Simulate every row of schedule_matrix (encoded as in get_schedules)
+        from the current state in one pass, and return the reward of each row
+        """
+        return self._get_compiled().simulate_batch(schedule_matrix, schedule_type, mode_num)
+
+    def get_fidelity(self, horizon=1.0, car_fraction=1.0, tick_size=1, seed=0):
+        """
+        Cheaper approximation of the simulation from the current state, as a
+        VectorizedSimulator (see VectorizedSimulator.get_fidelity)
+        """
+        return self._get_compiled().get_fidelity(horizon, car_fraction, tick_size, seed)
+
+    def _get_compiled(self):
+        """
+        VectorizedSimulator of the network and cars, loaded with the current
+        state. It is compiled once, and again only if the network or cars
+        were replaced or the network was modified (see Network.version):
+        routes are assumed not to change once the cars are built.
+        """
+        from simulation.engine import VectorizedSimulator
+        network, cars, version = self._compiled_from or (None, None, None)
+        if self._compiled is None or network is not self.network or cars is not self.cars \
+                or version != self.network.version:
+            self._compiled = VectorizedSimulator.from_simulator(self)
+            self._compiled_from = (self.network, self.cars, self.network.version)
+            return self._compiled
+        self._compiled.sim_len = self.sim_len
+        self._compiled.fifo = self.fifo
+        self._compiled.initial_state = self.initial_state
+        self._compiled.restore(self.snapshot())
+        return self._compiled
+
+    def get_uniform_schedules(self, red_len, green_len):
         schedules = []
         for junction in self.network.junctions:
             schedules.append(PeriodicSchedule([red_len, green_len]))
-        self.simulate(schedules)
+        return schedules
 
-    def simulate_distinct(self, red_lens, green_lens):
+    def get_distinct_schedules(self, red_lens, green_lens):
         schedules = []
         for i in range(len(self.network.junctions)):
-            junction = self.network.junctions[i]
             red_len = red_lens[i]
             green_len = green_lens[i]
             schedules.append(PeriodicSchedule([red_len, green_len]))
-        self.simulate(schedules)
+        return schedules
 
-    def simulate_preset(self, red_lens, green_lens, modes):
+    def get_round_robin_schedules(self, durations):
+        """ Green for every in_rds of each junction in turn, durations listed junction by junction """
+        in_degree = [len(junction.in_rds) for junction in self.network.junctions]
+        offsets = np.cumsum([0] + in_degree).tolist()
+        assert len(durations) == offsets[-1]
+        return [PhaseSchedule.get_round_robin(durations[offsets[i]:offsets[i + 1]])
+                for i in range(len(in_degree))]
+
+    @staticmethod
+    def get_preset_schedules(red_lens, green_lens, modes):
         preset_schedules = []
         assert(len(red_lens) == len(green_lens))
         for i in range(len(red_lens)):
@@ -124,17 +306,139 @@ class Simulator:
         schedules = []
         for mode in modes:
             schedules.append(preset_schedules[mode])
-        self.simulate(schedules)
+        return schedules
+
+    def get_schedules(self, x, schedule_type='uniform', mode_num=2):
+        """
+        Decode a parameter vector of the emulators into a schedule per junction
+
+        uniform: [red, green]
+        distinct: [red_0, green_0, red_1, green_1, ...]
+        preset: [red_0, ..., red_m, green_0, ..., green_m, mode_0, mode_1, ...]
+        forced_preset: [cycle_len, mode_0, mode_1, ...]
+        round_robin: [duration of every in_rds of junction 0, then of junction 1, ...]
+        """
+        x = list(map(int, x))
+        if schedule_type == 'uniform':
+            return self.get_uniform_schedules(x[0], x[1])
+        elif schedule_type == 'distinct':
+            return self.get_distinct_schedules(x[::2], x[1::2])
+        elif schedule_type == 'preset':
+            return self.get_preset_schedules(x[:mode_num], x[mode_num:mode_num * 2],
+                                             x[mode_num * 2:])
+        elif schedule_type == 'forced_preset':
+            red_lens = [int(x[0] * i / (mode_num + 1)) for i in range(1, mode_num + 1)]
+            green_lens = [int(x[0] * i / (mode_num + 1)) for i in reversed(range(1, mode_num + 1))]
+            return self.get_preset_schedules(red_lens, green_lens, x[1:])
+        elif schedule_type == 'round_robin':
+            return self.get_round_robin_schedules(x)
+        else:
+            raise NameError('Invalid schedule option')
 
     def get_reward(self):
         return sum([car.reward for car in self.cars])
 
-    def reset(self):
-        for car in self.cars:
-            car.reset()
-        for road in self.network.roads:
+    def get_route_idx(self):
+        """ Index of each car's current road on its route """
+        return np.fromiter((car.idx for car in self.cars), dtype=np.int64,
+                           count=len(self.cars))
+
+    def get_queue_lengths(self):
+        """ Number of cars queued on each road """
+        return np.fromiter((len(road.get_queued()) for road in self.network.roads),
+                           dtype=np.int64, count=len(self.network.roads))
+
+    def get_in_degrees(self):
+        """ Number of roads into each junction """
+        return np.array([len(junction.in_rds) for junction in self.network.junctions],
+                        dtype=np.int64)
+
+    def get_queued_in_rds(self):
+        """
+        Roads with cars queued: the junction each ends at, its index among
+        the in_rds of the junction, and the number of cars queued on it
+        """
+        rows, idx, queue_len = [], [], []
+        for i, junction in enumerate(self.network.junctions):
+            for j, road in enumerate(junction.in_rds):
+                queued = road.get_queued()
+                if queued:
+                    rows.append(i)
+                    idx.append(j)
+                    queue_len.append(len(queued))
+        return (np.array(rows, dtype=np.int64), np.array(idx, dtype=np.int64),
+                np.array(queue_len, dtype=np.int64))
+
+    def get_downstream_lengths(self):
+        """
+        Number of cars queued on the road that the car released next from
+        each road listed by get_queued_in_rds would drive onto (0 if it
+        finishes there), in the same order
+        """
+        downstream = []
+        for junction in self.network.junctions:
+            for road in junction.in_rds:
+                queued = road.get_queued()
+                if queued:
+                    road = queued[0 if self.fifo else -1].get_next_road()
+                    downstream.append(0 if road is None else len(road.get_queued()))
+        return np.array(downstream, dtype=np.int64)
+
+    def snapshot(self) -> SimulatorState:
+        """ Capture the current state, to be restored later with restore """
+        car_ids = {car: i for i, car in enumerate(self.cars)}
+        top = np.full(len(self.network.roads), -1, dtype=np.int64)
+        below = np.full(len(self.cars), -1, dtype=np.int64)
+        for i, road in enumerate(self.network.roads):
+            for car in road.get_queued():
+                below[car_ids[car]] = top[i]
+                top[i] = car_ids[car]
+        return SimulatorState(self.clock,
+                              np.array([car.idx for car in self.cars], dtype=np.int64),
+                              np.array([car.dist for car in self.cars], dtype=np.int64),
+                              np.array([car.reward for car in self.cars], dtype=np.int64),
+                              top, below)
+
+    def restore(self, state: SimulatorState):
+        """
+        Put the cars and road queues back in the state of a snapshot. The
+        object model keeps its state on the Car and Road objects, so this
+        writes every car and rebuilds every queue one by one: it does not
+        restore in bulk. VectorizedSimulator.restore copies a snapshot back
+        into its arrays instead (as simulate_batch and ParallelEvaluator
+        do), which is what evaluating many candidates should go through.
+        """
+        for car, idx, dist, reward in zip(self.cars, state.idx.tolist(),
+                                          state.dist.tolist(), state.reward.tolist()):
+            car.idx = idx
+            car.dist = dist
+            car.reward = reward
+        below = state.below.tolist()
+        for road, car in zip(self.network.roads, state.top.tolist()):
             road.reset()
-        self.clock = 0
+            while car >= 0:
+                road.queue.append(self.cars[car])
+                car = below[car]
+            road.queue.reverse()
+        self.clock = state.clock
+
+    def reset(self):
+        """
+        Go back to the initial state of the input file if there is one (i.e.
+        every car queued at the end of its first road), otherwise put every
+        car at the start of its first road
+        """
+        start = time.perf_counter()
+        if self.initial_state is not None:
+            self.restore(self.initial_state)
+        else:
+            for car in self.cars:
+                car.reset()
+            for road in self.network.roads:
+                road.reset()
+            self.clock = 0
+        if self.profiler is not None:
+            self.profiler.add_time('reset', time.perf_counter() - start)
 
 
 if __name__ == "__main__":
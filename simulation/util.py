@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def get_bin_idx(bins, x):
     """ Get the bin that x would be allocated, cumulatively """
     x = x % sum(bins)
@@ -7,3 +10,22 @@ def get_bin_idx(bins, x):
         if x >= 0:
             idx += 1
     return idx
+
+
+def get_bin_table(bins):
+    """ Get the bin that each x in range(sum(bins)) would be allocated, as in get_bin_idx """
+    bins = list(bins)
+    order = [-1] + list(range(len(bins) - 1))
+    return np.repeat(np.array(order, dtype=np.int64), [bins[-1]] + bins[:-1])
+
+
+def swap_remove(items, pos, item):
+    """
+    Remove item from items in O(1) by moving the last item into its place,
+    given pos, the position of each item (which is kept up to date)
+    """
+    i = pos.pop(item)
+    last = items.pop()
+    if last is not item:
+        items[i] = last
+        pos[last] = i
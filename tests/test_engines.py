@@ -0,0 +1,77 @@
+"""
+Check that every engine gives the same reward as the object Simulator, on
+a small random network and on Hash Code inputs, for both queue orders.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from simulation.checkpoint import CheckpointSimulator
+from simulation.engine import VectorizedSimulator
+from simulation.events import EventDrivenSimulator
+from simulation.schedule import PeriodicSchedule, PhaseSchedule
+from simulation.simulator import Simulator
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+ENGINES = [VectorizedSimulator, EventDrivenSimulator, CheckpointSimulator]
+
+
+def get_random_schedules(simulator, rng):
+    """ Round-robin schedule of random durations for every junction, some of them 0 """
+    schedules = []
+    for junction in simulator.network.junctions:
+        duration = rng.integers(0, 5, max(len(junction.in_rds), 1)).tolist()
+        schedules.append(PhaseSchedule.get_round_robin(duration))
+    return schedules
+
+
+@pytest.mark.parametrize('fifo', [True, False])
+@pytest.mark.parametrize('engine', ENGINES)
+def test_random_network(engine, fifo):
+    simulator = Simulator(sim_len=200, fifo=fifo)
+    simulator.initialize_random_network(20, 100, rng=np.random.default_rng(0))
+    simulator.reset()
+    other = engine(sim_len=200, fifo=fifo)
+    other.initialize_random_network(20, 100, rng=np.random.default_rng(0))
+    other.reset()
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+        duration = rng.integers(1, 6, (20, 2)).tolist()
+        simulator.reset()
+        simulator.simulate([PeriodicSchedule(d) for d in duration])
+        other.reset()
+        other.simulate([PeriodicSchedule(d) for d in duration])
+        assert other.get_reward() == simulator.get_reward()
+
+
+@pytest.mark.parametrize('fifo', [True, False])
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('filename', ['a.txt', 'e.txt'])
+def test_text_input(filename, engine, fifo):
+    filepath = os.path.join(DATA, filename)
+    simulator = Simulator(fifo=fifo)
+    simulator.initialize_from_text(filepath)
+    other = engine(fifo=fifo)
+    other.load_text(filepath)
+    rng = np.random.default_rng(0)
+    for _ in range(2):
+        schedules = get_random_schedules(simulator, rng)
+        simulator.reset()
+        simulator.simulate(schedules)
+        other.reset()
+        other.simulate(schedules)
+        assert other.get_reward() == simulator.get_reward()
+
+
+@pytest.mark.parametrize('fifo', [True, False])
+def test_from_simulator(fifo):
+    simulator = Simulator(sim_len=200, fifo=fifo)
+    simulator.initialize_random_network(20, 100, rng=np.random.default_rng(2))
+    simulator.reset()
+    other = VectorizedSimulator.from_simulator(simulator)
+    schedules = get_random_schedules(simulator, np.random.default_rng(3))
+    simulator.simulate(schedules)
+    other.reset()
+    other.simulate(schedules)
+    assert other.get_reward() == simulator.get_reward()
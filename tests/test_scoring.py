@@ -0,0 +1,33 @@
+"""
+Check IncrementalHashCodeScorer against HashCodeScorer re-scoring from
+scratch, after updates and undos.
+"""
+import os
+
+import numpy as np
+
+from simulation.schedule import PhaseSchedule
+from simulation.scoring import HashCodeScorer, IncrementalHashCodeScorer
+
+DATA = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def test_update_and_undo():
+    incremental = IncrementalHashCodeScorer.from_text(os.path.join(DATA, 'e.txt'))
+    scorer = HashCodeScorer(incremental.text_input)
+    rng = np.random.default_rng(0)
+    schedules = [PhaseSchedule.get_round_robin(rng.integers(1, 4, len(rds)).tolist())
+                 for rds in incremental.junction_rds]
+    initial = incremental.score(schedules)
+    assert initial == scorer.score(schedules)
+
+    for junction in rng.choice(len(schedules), 20, replace=False).tolist():
+        rds = incremental.junction_rds[junction]
+        schedule = PhaseSchedule(zip(rng.permutation(len(rds)).tolist(),
+                                     rng.integers(0, 4, len(rds)).tolist()))
+        updated = list(schedules)
+        updated[junction] = schedule
+        assert incremental.update(junction, schedule) == scorer.score(updated)
+        incremental.undo()
+        assert incremental.current_score == initial
+        assert incremental.update(junction, schedules[junction]) == initial